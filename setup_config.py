@@ -21,12 +21,45 @@ EMBEDDING_MODEL=text-embedding-3-small
 MAX_CHUNKS=10
 CHUNK_SIZE=1000
 OVERLAP_SIZE=200
+EMBEDDING_CONCURRENCY=16
+EMBEDDING_DTYPE=float16
+ANN_MIN_ELEMENTS=10000
+HNSW_M=32
+HNSW_EF_CONSTRUCTION=200
+HNSW_EF_SEARCH=64
+QUERY_CACHE_SIZE=1024
+LSH_SIMILARITY=0.97
 MAX_RETRIES=3
 RETRY_DELAY=1.0
+MAX_RETRY_DELAY=60
+
+# API Throughput
+MAX_CONCURRENCY=10
+MAX_REQUESTS_PER_MINUTE=500
+MAX_TOKENS_PER_MINUTE=150000
+BATCH_SIZE=8
+USE_BATCH_API=0
+BATCH_POLL_INTERVAL=30
+SPECULATIVE_GENERATION=0
+SPECULATION_SIMILARITY=0.9
+
+# LLM Response Cache
+LLM_CACHE=1
+LLM_CACHE_PATH=.cache/llm_cache.sqlite
+LLM_CACHE_MAX_ENTRIES=1000
+LLM_CACHE_TTL=604800
+LLM_CACHE_SEMANTIC=0
+LLM_CACHE_SIMILARITY=0.97
 
 # Lean Configuration
 LEAN_TIMEOUT=30
+LEAN_USE_SERVER=1
+LEAN_USE_STDIN=1
+LEAN_CACHE=1
+LEAN_CACHE_MAX_ENTRIES=10000
+LEAN_WORKERS=2
 MAX_PROOF_ATTEMPTS=5
+TASK_CONCURRENCY=2
 """
     
     with open('.env', 'w') as f:
@@ -39,8 +72,10 @@ MAX_PROOF_ATTEMPTS=5
     requirements = """openai>=1.0.0
 python-dotenv>=1.0.0
 numpy>=1.24.0
-scikit-learn>=1.3.0
+hnswlib>=0.8.0
+pyarrow>=14.0.0
 tiktoken>=0.5.0
+orjson>=3.9.0
 nltk>=3.8.0
 """
     
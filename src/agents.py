@@ -11,15 +11,32 @@ Implements Planning, Generation, and Verification agents
 import os
 import openai
 import json
+import logging
 import time
-from typing import Dict, List, Optional, Tuple
+import random
+import hashlib
+import asyncio
+import weakref
+import functools
+import threading
+import tiktoken
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
 
+try:
+    import orjson
+except ImportError:  # Faster JSON parsing is optional; fall back to the standard library
+    orjson = None
+
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
 
+from llm_cache import LLMCache, get_llm_cache
+
+logger = logging.getLogger(__name__)
+
 @dataclass
 class AgentResponse:
     """Standardized response format for all agents"""
@@ -28,238 +45,686 @@ class AgentResponse:
     metadata: Dict = None
     errors: List[str] = None
 
+# Shared throttling for API calls across all agents
+MAX_CONCURRENCY = int(os.getenv('MAX_CONCURRENCY', 10))
+MAX_REQUESTS_PER_MINUTE = float(os.getenv('MAX_REQUESTS_PER_MINUTE', 500))
+MAX_TOKENS_PER_MINUTE = float(os.getenv('MAX_TOKENS_PER_MINUTE', 150000))
+
+_semaphores = weakref.WeakKeyDictionary()
+
+def _concurrency_gate() -> asyncio.Semaphore:
+    """Return the semaphore bounding in-flight API calls on the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _semaphores[loop]
+
+def parse_json(text: str):
+    """json.loads, via orjson when installed (its errors subclass json.JSONDecodeError)"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def _prompt_text(messages: List[Dict]) -> str:
+    """Concatenate message contents into a single string"""
+    return "\n".join(m.get('content', '') for m in messages)
+
+def _strip_code_fences(text: str) -> str:
+    """Remove surrounding markdown code block markers from a model response"""
+    cleaned_content = text.strip()
+    if cleaned_content.startswith('```json'):
+        cleaned_content = cleaned_content[7:]  # Remove ```json
+    if cleaned_content.startswith('```'):
+        cleaned_content = cleaned_content[3:]   # Remove ```
+    if cleaned_content.endswith('```'):
+        cleaned_content = cleaned_content[:-3]  # Remove trailing ```
+    return cleaned_content.strip()
+
+@functools.lru_cache(maxsize=None)
+def _encoding_for(model_name: str):
+    """tiktoken encoding for a model, or None if it cannot be loaded"""
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        # Unknown model; the generic encoding may also need a download
+        try:
+            return tiktoken.get_encoding('cl100k_base')
+        except Exception:
+            return None
+    except Exception:
+        return None
+
+def _estimate_tokens(messages: List[Dict], model_name: str, max_tokens: int) -> int:
+    """Token estimate for a chat request (prompt + completion budget)"""
+    encoding = _encoding_for(model_name)
+    if encoding is not None:
+        try:
+            # Roughly 4 tokens of framing per message
+            prompt_tokens = sum(4 + len(encoding.encode(m.get('content', ''))) for m in messages)
+            return prompt_tokens + max_tokens
+        except Exception:
+            pass
+    return len(_prompt_text(messages)) // 4 + max_tokens
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds requested by the server's Retry-After header, if any"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """
+    Request and token budgets shared by all agents, refilled continuously
+
+    Each bucket holds at most one minute's worth of capacity. Callers
+    reserve one request plus their estimated tokens before calling the API.
+    """
+    
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_requests = requests_per_minute
+        self.available_tokens = tokens_per_minute
+        self.last_update = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _reserve(self, tokens: int) -> float:
+        """Take capacity if available; otherwise return seconds to wait before retrying"""
+        tokens = min(tokens, self.tokens_per_minute)
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self.last_update
+            self.last_update = now
+            self.available_requests = min(
+                self.requests_per_minute,
+                self.available_requests + self.requests_per_minute * elapsed / 60.0
+            )
+            self.available_tokens = min(
+                self.tokens_per_minute,
+                self.available_tokens + self.tokens_per_minute * elapsed / 60.0
+            )
+            
+            if self.available_requests >= 1 and self.available_tokens >= tokens:
+                self.available_requests -= 1
+                self.available_tokens -= tokens
+                return 0.0
+            
+            request_wait = (1 - self.available_requests) * 60.0 / self.requests_per_minute
+            token_wait = (tokens - self.available_tokens) * 60.0 / self.tokens_per_minute
+            return max(request_wait, token_wait, 0.001)
+    
+    def acquire(self, tokens: int):
+        """Block until one request of `tokens` tokens fits the budget"""
+        while (wait := self._reserve(tokens)) > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self, tokens: int):
+        """Async variant of acquire()"""
+        while (wait := self._reserve(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+_token_bucket = TokenBucket(MAX_REQUESTS_PER_MINUTE, MAX_TOKENS_PER_MINUTE)
+
+class Coalescer:
+    """
+    Share one in-flight call between concurrent callers with the same key
+    
+    The call is cancelled only once every caller waiting on it has been cancelled.
+    Calls are only shared within one event loop, since a task cannot be awaited
+    from another loop.
+    """
+    
+    def __init__(self):
+        # loop -> key -> [task, number of waiting callers]
+        self._loops = weakref.WeakKeyDictionary()
+    
+    @property
+    def _inflight(self) -> Dict[str, list]:
+        """In-flight calls on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if loop not in self._loops:
+            self._loops[loop] = {}
+        return self._loops[loop]
+    
+    @staticmethod
+    def make_key(*parts) -> str:
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        inflight = self._inflight
+        entry = inflight.get(key)
+        if entry is None or self._cancelled(entry[0]):
+            entry = [asyncio.ensure_future(factory()), 0]
+            inflight[key] = entry
+            entry[0].add_done_callback(lambda _: self._forget(key, entry))
+        
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                # Later callers must start a new call rather than join this one
+                self._forget(key, entry)
+                entry[0].cancel()
+    
+    @staticmethod
+    def _cancelled(task: asyncio.Future) -> bool:
+        """Whether a call is cancelled or on its way to being cancelled"""
+        cancelling = getattr(task, 'cancelling', None)  # Python 3.11+
+        return task.cancelled() or (cancelling is not None and cancelling() > 0)
+    
+    def _forget(self, key: str, entry: list):
+        inflight = self._inflight
+        if inflight.get(key) is entry:
+            del inflight[key]
+
+_coalescer = Coalescer()
+
 class BaseAgent(ABC):
     """Base class for all agents in the system"""
     
+    # Used in error messages ("<stage_name> failed: ...")
+    stage_name = "Agent"
+    temperature = 0.7
+    max_tokens = 2000
+    
     def __init__(self, model_name: str, max_retries: int = 3):
         self.client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self._async_clients = weakref.WeakKeyDictionary()
         self.model_name = model_name
         self.max_retries = max_retries
         self.retry_delay = float(os.getenv('RETRY_DELAY', 1.0))
+        self.max_retry_delay = float(os.getenv('MAX_RETRY_DELAY', 60.0))
+        self.embedding_model = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+        self.cache = get_llm_cache()
+    
+    @property
+    def async_client(self) -> openai.AsyncOpenAI:
+        """Async client for the running event loop (connections cannot be shared across loops)"""
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            self._async_clients[loop] = openai.AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        return self._async_clients[loop]
     
-    def _make_api_call(self, messages: List[Dict], temperature: float = 0.7) -> str:
-        """Make OpenAI API call with retry logic"""
+    def _make_api_call(self, messages: List[Dict], temperature: float = 0.7,
+                       use_cache: bool = True) -> str:
+        """
+        Make OpenAI API call, answering from the response cache when possible
+        
+        With use_cache=False the cache is not consulted, but the fresh response
+        replaces any stored one.
+        """
+        if self.cache is None:
+            return self._request_completion(messages, temperature)
+        
+        key = LLMCache.make_key(messages, self.model_name, temperature)
+        scope = LLMCache.make_scope(self.model_name, temperature)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        embedding = None
+        if self.cache.semantic:
+            embedding = self._embed_prompt(messages)
+            cached = self.cache.get_similar(embedding, scope) if use_cache else None
+            if cached is not None:
+                return cached
+        
+        response_content = self._request_completion(messages, temperature)
+        self.cache.put(key, response_content, scope, embedding)
+        return response_content
+    
+    async def _make_api_call_async(self, messages: List[Dict], temperature: float = 0.7,
+                                   use_cache: bool = True) -> str:
+        """Async variant of _make_api_call"""
+        if self.cache is None:
+            return await self._request_completion_async(messages, temperature)
+        
+        key = LLMCache.make_key(messages, self.model_name, temperature)
+        scope = LLMCache.make_scope(self.model_name, temperature)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        embedding = None
+        if self.cache.semantic:
+            embedding = await self._embed_prompt_async(messages)
+            cached = self.cache.get_similar(embedding, scope) if use_cache else None
+            if cached is not None:
+                return cached
+        
+        response_content = await self._request_completion_async(messages, temperature)
+        self.cache.put(key, response_content, scope, embedding)
+        return response_content
+    
+    def _request_completion(self, messages: List[Dict], temperature: float) -> str:
+        """Make OpenAI API call with rate limiting and retry logic"""
+        tokens = _estimate_tokens(messages, self.model_name, self.max_tokens)
+        delay = self.retry_delay
         for attempt in range(self.max_retries):
             try:
+                _token_bucket.acquire(tokens)
                 response = self.client.chat.completions.create(
                     model=self.model_name,
                     messages=messages,
                     temperature=temperature,
-                    max_tokens=2000
+                    max_tokens=self.max_tokens
                 )
                 return response.choices[0].message.content
             except Exception as e:
                 if attempt == self.max_retries - 1:
                     raise e
-                time.sleep(self.retry_delay * (2 ** attempt))  # Exponential backoff
+                delay = self._backoff(delay)
+                time.sleep(_retry_after(e) or delay)
+    
+    async def _request_completion_async(self, messages: List[Dict], temperature: float) -> str:
+        """Make OpenAI API call without blocking the event loop, throttled across agents"""
+        tokens = _estimate_tokens(messages, self.model_name, self.max_tokens)
+        delay = self.retry_delay
+        for attempt in range(self.max_retries):
+            try:
+                await _token_bucket.acquire_async(tokens)
+                async with _concurrency_gate():
+                    response = await self.async_client.chat.completions.create(
+                        model=self.model_name,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=self.max_tokens
+                    )
+                return response.choices[0].message.content
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise e
+                delay = self._backoff(delay)
+                await asyncio.sleep(_retry_after(e) or delay)
+    
+    def _backoff(self, previous_delay: float) -> float:
+        """Decorrelated jitter: spread retries so concurrent callers do not collide"""
+        return min(self.max_retry_delay, random.uniform(self.retry_delay, previous_delay * 3))
+    
+    def _embed_prompt(self, messages: List[Dict]) -> Optional[List[float]]:
+        """
+        Embed the final message for semantic cache lookups
         
+        Earlier messages hold the system prompt and examples shared by every
+        task, which would make unrelated requests look alike.
+        """
+        try:
+            response = self.client.embeddings.create(
+                model=self.embedding_model,
+                input=[messages[-1].get('content', '')]
+            )
+            return response.data[0].embedding
+        except Exception as e:
+            logger.warning("Prompt embedding failed, skipping semantic cache: %s", e)
+            return None
+    
+    async def _embed_prompt_async(self, messages: List[Dict]) -> Optional[List[float]]:
+        """Async variant of _embed_prompt"""
+        try:
+            response = await self.async_client.embeddings.create(
+                model=self.embedding_model,
+                input=[messages[-1].get('content', '')]
+            )
+            return response.data[0].embedding
+        except Exception as e:
+            logger.warning("Prompt embedding failed, skipping semantic cache: %s", e)
+            return None
+    
+    def _early_response(self, input_data: Dict) -> Optional[AgentResponse]:
+        """Return a response without calling the API, or None to proceed"""
+        return None
+    
+    @staticmethod
+    def _use_cache(input_data: Dict) -> bool:
+        """Only first attempts may be answered from the cache; retries must ask the model again"""
+        return input_data.get('attempt_number', 1) <= 1
+    
     @abstractmethod
-    def process(self, input_data: Dict) -> AgentResponse:
-        """Process input and return response"""
+    def _build_messages(self, input_data: Dict) -> List[Dict]:
+        """Build the chat messages for this agent"""
+        pass
+    
+    @abstractmethod
+    def _parse_response(self, input_data: Dict, response_content: str) -> AgentResponse:
+        """Turn the raw model output into an AgentResponse"""
         pass
-
-class PlanningAgent(BaseAgent):
-    """Agent responsible for task decomposition and strategy planning"""
     
-    def __init__(self):
-        super().__init__(os.getenv('GPT4_MODEL', 'gpt-4o'))
-        
     def process(self, input_data: Dict) -> AgentResponse:
-        """
-        Create a plan for solving the Lean theorem proving task
-        
-        Args:
-            input_data: Dict containing 'description' and 'task_template'
-        """
+        """Process input and return response"""
         try:
-            description = input_data.get('description', '')
-            task_template = input_data.get('task_template', '')
+            early = self._early_response(input_data)
+            if early is not None:
+                return early
             
-            messages = [
-                {
-                    "role": "system", 
-                    "content": """You are a Lean 4 theorem proving expert and planning agent. 
-                    Your job is to analyze programming tasks and create detailed implementation plans.
-                    
-                    You should:
-                    1. Break down the problem into logical steps
-                    2. Identify key Lean 4 concepts and tactics needed
-                    3. Suggest an implementation approach
-                    4. Anticipate potential proof challenges
-                    5. Recommend relevant Lean 4 libraries or theorems
-                    
-                    Return your response as JSON with these fields:
-                    - strategy: High-level approach
-                    - implementation_steps: List of specific coding steps
-                    - proof_approach: Strategy for proving correctness
-                    - lean_concepts: Relevant Lean 4 concepts to use
-                    - potential_challenges: Anticipated difficulties
-                    """
-                },
-                {
-                    "role": "user",
-                    "content": f"""Task Description: {description}
-                    
-                    Task Template: {task_template}
-                    
-                    Please create a detailed implementation plan for this Lean 4 theorem proving task."""
-                }
-            ]
+            messages = self._build_messages(input_data)
+            response_content = self._make_api_call(
+                messages, temperature=self.temperature, use_cache=self._use_cache(input_data)
+            )
+            return self._parse_response(input_data, response_content)
             
-            response_content = self._make_api_call(messages, temperature=0.3)
+        except Exception as e:
+            return AgentResponse(
+                success=False,
+                content="",
+                errors=[f"{self.stage_name} failed: {str(e)}"]
+            )
+    
+    async def process_async(self, input_data: Dict) -> AgentResponse:
+        """Async variant of process() for running many agent calls concurrently"""
+        try:
+            early = self._early_response(input_data)
+            if early is not None:
+                return early
             
-            # Try to parse as JSON, fallback to text if needed
-            try:
-                plan_data = json.loads(response_content)
-            except json.JSONDecodeError:
-                plan_data = {"strategy": response_content}
+            messages = self._build_messages(input_data)
             
-            return AgentResponse(
-                success=True,
-                content=response_content,
-                metadata={"plan": plan_data}
+            # Identical prompts already in flight (e.g. from concurrent tasks) share one call
+            use_cache = self._use_cache(input_data)
+            key = Coalescer.make_key(messages, self.model_name, self.temperature, use_cache)
+            response_content = await _coalescer.run(
+                key, lambda: self._make_api_call_async(
+                    messages, temperature=self.temperature, use_cache=use_cache
+                )
             )
+            return self._parse_response(input_data, response_content)
             
         except Exception as e:
             return AgentResponse(
                 success=False,
                 content="",
-                errors=[f"Planning failed: {str(e)}"]
+                errors=[f"{self.stage_name} failed: {str(e)}"]
             )
 
+async def process_many_async(agent: BaseAgent, inputs: List[Dict]) -> List[AgentResponse]:
+    """
+    Run one agent over many independent inputs concurrently
+    
+    Args:
+        agent: Any agent instance
+        inputs: List of input dicts for agent.process
+        
+    Returns:
+        List of AgentResponse in the same order as inputs
+    """
+    return list(await asyncio.gather(*[agent.process_async(d) for d in inputs]))
+
+class PlanningAgent(BaseAgent):
+    """Agent responsible for task decomposition and strategy planning"""
+    
+    stage_name = "Planning"
+    temperature = 0.3
+    
+    def __init__(self):
+        super().__init__(os.getenv('GPT4_MODEL', 'gpt-4o'))
+    
+    def _build_messages(self, input_data: Dict) -> List[Dict]:
+        """
+        Create a plan for solving the Lean theorem proving task
+        
+        Args:
+            input_data: Dict containing 'description' and 'task_template'
+        """
+        description = input_data.get('description', '')
+        task_template = input_data.get('task_template', '')
+        
+        return [
+            {
+                "role": "system", 
+                "content": """You are a Lean 4 theorem proving expert and planning agent. 
+                Your job is to analyze programming tasks and create detailed implementation plans.
+                
+                You should:
+                1. Break down the problem into logical steps
+                2. Identify key Lean 4 concepts and tactics needed
+                3. Suggest an implementation approach
+                4. Anticipate potential proof challenges
+                5. Recommend relevant Lean 4 libraries or theorems
+                
+                Return your response as JSON with these fields:
+                - strategy: High-level approach
+                - implementation_steps: List of specific coding steps
+                - proof_approach: Strategy for proving correctness
+                - lean_concepts: Relevant Lean 4 concepts to use
+                - potential_challenges: Anticipated difficulties
+                """
+            },
+            {
+                "role": "user",
+                "content": f"""Task Description: {description}
+                
+                Task Template: {task_template}
+                
+                Please create a detailed implementation plan for this Lean 4 theorem proving task."""
+            }
+        ]
+    
+    def _parse_response(self, input_data: Dict, response_content: str) -> AgentResponse:
+        # Try to parse as JSON, fallback to text if needed
+        try:
+            plan_data = parse_json(response_content)
+        except json.JSONDecodeError:
+            plan_data = {"strategy": response_content}
+        
+        return AgentResponse(
+            success=True,
+            content=response_content,
+            metadata={"plan": plan_data}
+        )
+
 class GenerationAgent(BaseAgent):
     """Agent responsible for generating Lean 4 code and proofs"""
     
+    stage_name = "Generation"
+    temperature = 0.1
+    
+    SYSTEM_PROMPT = """You are an expert Lean 4 programmer. Your job is to generate working Lean 4 code and formal proofs.
+
+                CRITICAL REQUIREMENTS:
+                1. Generate ONLY the actual implementation code for {{code}} - NO comments, NO placeholders
+                2. Generate ONLY the actual proof tactics for {{proof}} - NO 'sorry', NO placeholders
+                3. For simple tasks: use 'rfl' or 'simp'
+                4. For complex conditionals: use 'simp [function_name]; split <;> omega'
+
+                PROOF TACTICS GUIDE:
+                - Simple equality: rfl
+                - Arithmetic and conditionals: omega
+                - Complex nested conditionals: omega (it handles everything!)
+
+                EXAMPLES:
+                - Addition proof: rfl
+                - Min/max proof: omega
+
+                CRITICAL: For complex conditionals, just use omega - it's the most powerful.
+
+                Return JSON with:
+                - code: the actual implementation
+                - proof: the actual proof tactics  
+                - explanation: brief explanation
+
+                DO NOT USE: sorry, placeholder text, comments like "Implementation needed"
+                """
+    
+    STYLE_EXAMPLES = """For minOfThree function, use EXACTLY this pattern:
+              - code: "if a <= b then if a <= c then a else c else if b <= c then b else c"
+              - proof: "split; · split <;> omega; · split <;> omega"
+              
+              For addition function, use EXACTLY this pattern:
+              - code: "a + b"  
+              - proof: "rfl"
+              
+              Return JSON with the EXACT patterns above - do not modify them."""
+    
     def __init__(self):
         super().__init__(os.getenv('GPT4_MODEL', 'gpt-4o'))
+        self.batch_size = int(os.getenv('BATCH_SIZE', 8))
     
-    def process(self, input_data: Dict) -> AgentResponse:
+    def _build_messages(self, input_data: Dict) -> List[Dict]:
         """
         Generate Lean 4 code and proof based on plan and context
         
         Args:
             input_data: Dict containing 'description', 'task_template', 'plan', 'rag_context'
         """
+        description = input_data.get('description', '')
+        task_template = input_data.get('task_template', '')
+        plan = input_data.get('plan', '')
+        rag_context = input_data.get('rag_context', '')
+        previous_attempts = input_data.get('previous_attempts', [])
+        
+        # Stable content goes first so the shared prefix can be served from
+        # the provider's prompt cache; per-task content goes in the last message
+        messages = [
+            {
+                "role": "system",
+                "content": self.SYSTEM_PROMPT
+            },
+            {
+                "role": "system",
+                "content": self.STYLE_EXAMPLES
+            }
+        ]
+        
+        if rag_context:
+            messages.append({
+                "role": "system",
+                "content": f"Relevant Lean 4 documentation and examples:\n{rag_context}"
+            })
+        
+        attempts_prompt = ""
+        if previous_attempts:
+            attempts_prompt = f"\n\nPrevious attempts (avoid these errors):\n"
+            for i, attempt in enumerate(previous_attempts[-3:], 1):  # Last 3 attempts
+                attempts_prompt += f"Attempt {i}: {attempt.get('error', 'Unknown error')}\n"
+        
+        messages.append({
+            "role": "user",
+            "content": f"""Task: {description}
+              
+              Template: {task_template}
+              
+              Plan: {plan}
+              {attempts_prompt}"""
+        })
+        
+        return messages
+    
+    def _parse_response(self, input_data: Dict, response_content: str) -> AgentResponse:
         try:
-            description = input_data.get('description', '')
-            task_template = input_data.get('task_template', '')
-            plan = input_data.get('plan', '')
-            rag_context = input_data.get('rag_context', '')
-            previous_attempts = input_data.get('previous_attempts', [])
-            
-            # Build context-aware prompt
-            context_prompt = ""
-            if rag_context:
-                context_prompt = f"\n\nRelevant Lean 4 documentation and examples:\n{rag_context}"
-            
-            if previous_attempts:
-                context_prompt += f"\n\nPrevious attempts (avoid these errors):\n"
-                for i, attempt in enumerate(previous_attempts[-3:], 1):  # Last 3 attempts
-                    context_prompt += f"Attempt {i}: {attempt.get('error', 'Unknown error')}\n"
+            cleaned_content = _strip_code_fences(response_content)
             
-            messages = [
-                {
-                    "role": "system",
-                    "content": """You are an expert Lean 4 programmer. Your job is to generate working Lean 4 code and formal proofs.
-
-                    CRITICAL REQUIREMENTS:
-                    1. Generate ONLY the actual implementation code for {{code}} - NO comments, NO placeholders
-                    2. Generate ONLY the actual proof tactics for {{proof}} - NO 'sorry', NO placeholders
-                    3. For simple tasks: use 'rfl' or 'simp'
-                    4. For complex conditionals: use 'simp [function_name]; split <;> omega'
-
-                    PROOF TACTICS GUIDE:
-                    - Simple equality: rfl
-                    - Arithmetic and conditionals: omega
-                    - Complex nested conditionals: omega (it handles everything!)
-
-                    EXAMPLES:
-                    - Addition proof: rfl
-                    - Min/max proof: omega
-
-                    CRITICAL: For complex conditionals, just use omega - it's the most powerful.
-
-                    Return JSON with:
-                    - code: the actual implementation
-                    - proof: the actual proof tactics  
-                    - explanation: brief explanation
-
-                    DO NOT USE: sorry, placeholder text, comments like "Implementation needed"
-                    """
-                },
-                {
-                  "role": "user", 
-                  "content": f"""Task: {description}
-                  
-                  Template: {task_template}
-                  
-                  For minOfThree function, use EXACTLY this pattern:
-                  - code: "if a <= b then if a <= c then a else c else if b <= c then b else c"
-                  - proof: "split; · split <;> omega; · split <;> omega"
-                  
-                  For addition function, use EXACTLY this pattern:
-                  - code: "a + b"  
-                  - proof: "rfl"
-                  
-                  Plan: {plan}
-                  {context_prompt}
-                  
-                  Return JSON with the EXACT patterns above - do not modify them."""
-              }
-            ]
+            logger.debug("Cleaned content: %s", cleaned_content)
             
-            response_content = self._make_api_call(messages, temperature=0.1)
-            
-            try:
-                # Clean the response content - remove markdown code blocks
-                cleaned_content = response_content.strip()
-                if cleaned_content.startswith('```json'):
-                    cleaned_content = cleaned_content[7:]  # Remove ```json
-                if cleaned_content.startswith('```'):
-                    cleaned_content = cleaned_content[3:]   # Remove ```
-                if cleaned_content.endswith('```'):
-                    cleaned_content = cleaned_content[:-3]  # Remove trailing ```
-                cleaned_content = cleaned_content.strip()
-                
-                print(f"DEBUG: Cleaned content: {cleaned_content}")
+            result = parse_json(cleaned_content)
+            if 'code' not in result or 'proof' not in result:
+                raise ValueError("Missing required fields")
                 
-                result = json.loads(cleaned_content)
-                if 'code' not in result or 'proof' not in result:
-                    raise ValueError("Missing required fields")
-                    
-                print(f"DEBUG: Successfully parsed JSON: {result}")
-            
-            except (json.JSONDecodeError, ValueError) as e:
-                print(f"DEBUG: JSON parsing failed: {e}")
-                print(f"DEBUG: Original content: {response_content}")
-                # Fallback: try to extract code and proof from text
-                result = self._extract_code_and_proof(response_content)
-
-            # Force working patterns for known tasks
-            if 'minimum' in input_data.get('description', '').lower() or 'three' in input_data.get('description', '').lower():
-                result = {
-                    "code": "if a <= b then if a <= c then a else c else if b <= c then b else c",
-                    "proof": "omega",
-                    "explanation": "Exact working minOfThree pattern"
-                }
-                print("DEBUG: Forcing working minOfThree pattern")
+            logger.debug("Successfully parsed JSON: %s", result)
+        
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.debug("JSON parsing failed: %s", e)
+            logger.debug("Original content: %s", response_content)
+            # Fallback: try to extract code and proof from text
+            result = self._extract_code_and_proof(response_content)
 
-            return AgentResponse(
-                success=True,
-                content=json.dumps(result),
-                metadata=result
+        return self._finalize_result(input_data, result)
+    
+    def _finalize_result(self, input_data: Dict, result: Dict) -> AgentResponse:
+        """Apply known-task overrides and wrap a parsed result"""
+        # Force working patterns for known tasks
+        if 'minimum' in input_data.get('description', '').lower() or 'three' in input_data.get('description', '').lower():
+            result = {
+                "code": "if a <= b then if a <= c then a else c else if b <= c then b else c",
+                "proof": "omega",
+                "explanation": "Exact working minOfThree pattern"
+            }
+            logger.debug("Forcing working minOfThree pattern")
+
+        return AgentResponse(
+            success=True,
+            content=json.dumps(result),
+            metadata=result
+        )
+    
+    def process_batch(self, tasks: List[Dict]) -> List[AgentResponse]:
+        """
+        Generate solutions for many tasks, packing up to BATCH_SIZE tasks per API call
+        
+        Args:
+            tasks: List of input dicts as accepted by process()
+            
+        Returns:
+            List of AgentResponse in the same order as tasks
+        """
+        responses = []
+        for i in range(0, len(tasks), self.batch_size):
+            responses.extend(self._process_group(tasks[i:i + self.batch_size]))
+        return responses
+    
+    def _process_group(self, tasks: List[Dict]) -> List[AgentResponse]:
+        """Solve a group of tasks in one call, splitting in half if the reply is malformed"""
+        if len(tasks) == 1:
+            return [self.process(tasks[0])]
+        
+        try:
+            response_content = self._make_api_call(
+                self._build_batch_messages(tasks), temperature=self.temperature
             )
+            results = parse_json(_strip_code_fences(response_content))
+            if not isinstance(results, list) or len(results) != len(tasks):
+                raise ValueError("Batch response does not match number of tasks")
+            for result in results:
+                if not isinstance(result, dict) or 'code' not in result or 'proof' not in result:
+                    raise ValueError("Missing required fields")
             
+            return [self._finalize_result(task, result) for task, result in zip(tasks, results)]
+        
         except Exception as e:
-            return AgentResponse(
-                success=False,
-                content="",
-                errors=[f"Generation failed: {str(e)}"]
-            )
+            logger.debug("Batch of %d failed (%s), splitting", len(tasks), e)
+            middle = len(tasks) // 2
+            return self._process_group(tasks[:middle]) + self._process_group(tasks[middle:])
+    
+    def _build_batch_messages(self, tasks: List[Dict]) -> List[Dict]:
+        """Build one request covering several tasks so the system prompt is sent once"""
+        payload = [
+            {
+                'id': i,
+                'description': task.get('description', ''),
+                'template': task.get('task_template', ''),
+                'plan': task.get('plan', '')
+            }
+            for i, task in enumerate(tasks)
+        ]
+        
+        return [
+            {
+                "role": "system",
+                "content": self.SYSTEM_PROMPT
+            },
+            {
+                "role": "system",
+                "content": self.STYLE_EXAMPLES
+            },
+            {
+                "role": "user",
+                "content": "Return a JSON array where element i solves task i, "
+                           "each element being an object with code, proof and explanation:\n"
+                           + json.dumps(payload)
+            }
+        ]
     
     def _extract_code_and_proof(self, text: str) -> Dict:
         """Fallback method with exact working patterns"""
-        print(f"DEBUG: Using exact working patterns")
+        logger.debug("Using exact working patterns")
         
         if "minimum" in text.lower() or "min" in text.lower() or "three" in text.lower():
             code = "if a <= b then if a <= c then a else c else if b <= c then b else c"
@@ -276,91 +741,87 @@ class GenerationAgent(BaseAgent):
             "explanation": explanation
         }
         
-        print(f"DEBUG: Using exact pattern: {result}")
+        logger.debug("Using exact pattern: %s", result)
         return result
 
 class VerificationAgent(BaseAgent):
     """Agent responsible for verifying and debugging Lean 4 code"""
     
+    stage_name = "Verification"
+    temperature = 0.2
+    
     def __init__(self):
         super().__init__(os.getenv('GPT3_MODEL', 'gpt-3.5-turbo'))
     
-    def process(self, input_data: Dict) -> AgentResponse:
+    def _early_response(self, input_data: Dict) -> Optional[AgentResponse]:
+        if not input_data.get('error_output', ''):
+            return AgentResponse(
+                success=True,
+                content="No errors detected",
+                metadata={"verification_status": "passed"}
+            )
+        return None
+    
+    def _build_messages(self, input_data: Dict) -> List[Dict]:
         """
         Verify Lean 4 code and suggest corrections
         
         Args:
             input_data: Dict containing 'code', 'proof', 'error_output', 'rag_context'
         """
+        code = input_data.get('code', '')
+        proof = input_data.get('proof', '')
+        error_output = input_data.get('error_output', '')
+        rag_context = input_data.get('rag_context', '')
+        
+        context_prompt = ""
+        if rag_context:
+            context_prompt = f"\n\nRelevant documentation:\n{rag_context}"
+        
+        return [
+            {
+                "role": "system",
+                "content": """You are a Lean 4 debugging expert. Analyze compilation errors and suggest fixes.
+                
+                Your tasks:
+                1. Identify the root cause of errors
+                2. Suggest specific corrections
+                3. Provide corrected code/proof if possible
+                4. Explain the fix
+                
+                Return JSON with:
+                - error_analysis: Description of the problem
+                - suggested_fixes: List of specific corrections
+                - corrected_code: Fixed code (if applicable)  
+                - corrected_proof: Fixed proof (if applicable)
+                - confidence: Your confidence in the fix (0-1)
+                """
+            },
+            {
+                "role": "user",
+                "content": f"""Code: {code}
+                
+                Proof: {proof}
+                
+                Error Output: {error_output}
+                {context_prompt}
+                
+                Please analyze these errors and suggest fixes."""
+            }
+        ]
+    
+    def _parse_response(self, input_data: Dict, response_content: str) -> AgentResponse:
         try:
-            code = input_data.get('code', '')
-            proof = input_data.get('proof', '')
-            error_output = input_data.get('error_output', '')
-            rag_context = input_data.get('rag_context', '')
-            
-            if not error_output:
-                return AgentResponse(
-                    success=True,
-                    content="No errors detected",
-                    metadata={"verification_status": "passed"}
-                )
-            
-            context_prompt = ""
-            if rag_context:
-                context_prompt = f"\n\nRelevant documentation:\n{rag_context}"
-            
-            messages = [
-                {
-                    "role": "system",
-                    "content": """You are a Lean 4 debugging expert. Analyze compilation errors and suggest fixes.
-                    
-                    Your tasks:
-                    1. Identify the root cause of errors
-                    2. Suggest specific corrections
-                    3. Provide corrected code/proof if possible
-                    4. Explain the fix
-                    
-                    Return JSON with:
-                    - error_analysis: Description of the problem
-                    - suggested_fixes: List of specific corrections
-                    - corrected_code: Fixed code (if applicable)  
-                    - corrected_proof: Fixed proof (if applicable)
-                    - confidence: Your confidence in the fix (0-1)
-                    """
-                },
-                {
-                    "role": "user",
-                    "content": f"""Code: {code}
-                    
-                    Proof: {proof}
-                    
-                    Error Output: {error_output}
-                    {context_prompt}
-                    
-                    Please analyze these errors and suggest fixes."""
-                }
-            ]
-            
-            response_content = self._make_api_call(messages, temperature=0.2)
-            
-            try:
-                result = json.loads(response_content)
-            except json.JSONDecodeError:
-                result = {
-                    "error_analysis": response_content,
-                    "suggested_fixes": ["See error analysis"],
-                    "confidence": 0.5
-                }
-            
-            return AgentResponse(
-                success=True,
-                content=response_content,
-                metadata=result
-            )
-            
-        except Exception as e:
-            return AgentResponse(
-                success=False,
-                content="",
-                errors=[f"Verification failed: {str(e)}"]
-            )
+            result = parse_json(response_content)
+        except json.JSONDecodeError:
+            result = {
+                "error_analysis": response_content,
+                "suggested_fixes": ["See error analysis"],
+                "confidence": 0.5
+            }
+        
+        return AgentResponse(
+            success=True,
+            content=response_content,
+            metadata=result
+        )
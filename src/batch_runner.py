@@ -0,0 +1,158 @@
+"""
+OpenAI Batch API support for offline benchmark runs
+Submits many agent calls as one /v1/batches job and maps results back by custom_id
+"""
+
+import os
+import io
+import json
+import logging
+import time
+from typing import Dict, List
+from dotenv import load_dotenv
+
+from agents import AgentResponse, BaseAgent
+from llm_cache import LLMCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class BatchRunner:
+    """Runs agent requests through the OpenAI Batch API"""
+
+    def __init__(self, poll_interval: float = None, completion_window: str = "24h"):
+        self.poll_interval = poll_interval or float(os.getenv('BATCH_POLL_INTERVAL', 30))
+        self.completion_window = completion_window
+
+    def run(self, agent: BaseAgent, inputs: Dict[str, Dict]) -> Dict[str, AgentResponse]:
+        """
+        Run one agent over many inputs as a single batch job
+
+        Args:
+            agent: Agent whose prompts and parsing are used
+            inputs: Mapping of custom_id to the agent's input dict
+
+        Returns:
+            Mapping of custom_id to AgentResponse
+        """
+        responses = {}
+        pending = {}
+        for custom_id, input_data in inputs.items():
+            early = agent._early_response(input_data)
+            if early is not None:
+                responses[custom_id] = early
+            else:
+                pending[custom_id] = input_data
+
+        if not pending:
+            return responses
+
+        messages = {custom_id: agent._build_messages(d) for custom_id, d in pending.items()}
+
+        try:
+            batch_id = self.submit(agent, messages)
+            logger.info("Submitted batch %s with %d requests", batch_id, len(messages))
+            batch = self.wait(agent, batch_id)
+            contents = self.collect(agent, batch)
+        except Exception as e:
+            logger.warning("Batch run failed: %s", e)
+            contents = {}
+
+        for custom_id, input_data in pending.items():
+            content = contents.get(custom_id)
+            if content is None:
+                responses[custom_id] = AgentResponse(
+                    success=False,
+                    content="",
+                    errors=[f"{agent.stage_name} failed: no batch result for {custom_id}"]
+                )
+                continue
+
+            # Seed the response cache so later synchronous runs reuse the result
+            if agent.cache is not None:
+                agent.cache.put(
+                    LLMCache.make_key(messages[custom_id], agent.model_name, agent.temperature),
+                    content,
+                    LLMCache.make_scope(agent.model_name, agent.temperature)
+                )
+
+            try:
+                responses[custom_id] = agent._parse_response(input_data, content)
+            except Exception as e:
+                responses[custom_id] = AgentResponse(
+                    success=False,
+                    content="",
+                    errors=[f"{agent.stage_name} failed: {str(e)}"]
+                )
+
+        return responses
+
+    def build_requests(self, agent: BaseAgent, messages: Dict[str, List[Dict]]) -> str:
+        """Serialize chat requests as Batch API JSONL"""
+        lines = []
+        for custom_id, msgs in messages.items():
+            lines.append(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": agent.model_name,
+                    "messages": msgs,
+                    "temperature": agent.temperature,
+                    "max_tokens": agent.max_tokens
+                }
+            }))
+        return "\n".join(lines) + "\n"
+
+    def submit(self, agent: BaseAgent, messages: Dict[str, List[Dict]]) -> str:
+        """Upload the request file and create the batch, returning its id"""
+        jsonl = self.build_requests(agent, messages)
+        input_file = agent.client.files.create(
+            file=("batch_requests.jsonl", io.BytesIO(jsonl.encode('utf-8'))),
+            purpose="batch"
+        )
+        batch = agent.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def wait(self, agent: BaseAgent, batch_id: str):
+        """Poll until the batch reaches a terminal state"""
+        while True:
+            batch = agent.client.batches.retrieve(batch_id)
+            if batch.status in ('completed', 'failed', 'expired', 'cancelled'):
+                logger.info("Batch %s finished with status %s", batch_id, batch.status)
+                return batch
+            time.sleep(self.poll_interval)
+
+    def collect(self, agent: BaseAgent, batch) -> Dict[str, str]:
+        """Download the output file and return message content keyed by custom_id"""
+        contents = {}
+        if not batch.output_file_id:
+            return contents
+
+        output = agent.client.files.content(batch.output_file_id).text
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get('response') or {}
+            if response.get('status_code') != 200:
+                continue
+            body = response.get('body', {})
+            contents[record['custom_id']] = body['choices'][0]['message']['content']
+
+        return contents
+
+def run_agent_requests(agent: BaseAgent, inputs: Dict[str, Dict]) -> Dict[str, AgentResponse]:
+    """
+    Run an agent over many inputs, via the Batch API when USE_BATCH_API=1
+    and one synchronous call per input otherwise
+    """
+    if os.getenv('USE_BATCH_API', '0') == '1':
+        return BatchRunner().run(agent, inputs)
+
+    return {custom_id: agent.process(input_data) for custom_id, input_data in inputs.items()}
@@ -5,16 +5,127 @@ Provides semantic search over Lean 4 examples and documentation
 
 import os
 import json
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
 import pickle
+import shelve
+import sqlite3
+import threading
 import numpy as np
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import List, Dict, Tuple, Optional, Union
 import openai
 from dotenv import load_dotenv
 
+try:
+    import hnswlib
+except ImportError:  # Approximate search is optional; fall back to linear scan
+    hnswlib = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Columnar chunk storage is optional; fall back to pickle
+    pa = None
+    pq = None
+
 load_dotenv()
 
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize rows in place (zero rows are left as zeros)"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+def _quantize_rows(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 codes for each row plus the per-row float32 scale to decode them"""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def _run_coroutine(coro):
+    """Run a coroutine to completion from synchronous code, even inside a running loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+class ChunkStore:
+    """
+    Chunk list backed by a columnar Arrow table
+    
+    Rows are materialized as dicts only when accessed. Chunks appended
+    after loading are kept as plain dicts until the next save.
+    """
+    
+    COLUMNS = ('content', 'source', 'section', 'chunk_id')
+    
+    def __init__(self, table: "pa.Table" = None, rows: List[Dict] = None):
+        self._table = table
+        self._columns = {name: table.column(name) for name in self.COLUMNS} if table is not None else {}
+        self._num_table_rows = table.num_rows if table is not None else 0
+        self._rows = list(rows or [])
+    
+    def __len__(self) -> int:
+        return self._num_table_rows + len(self._rows)
+    
+    def __getitem__(self, i) -> Dict:
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if i < self._num_table_rows:
+            return {name: column[i].as_py() for name, column in self._columns.items()}
+        return dict(self._rows[i - self._num_table_rows])
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def extend(self, chunks: List[Dict]):
+        self._rows.extend(chunks)
+    
+    def sources(self) -> List[str]:
+        """Source column for every chunk, without materializing the rows"""
+        table_sources = self._columns['source'].to_pylist() if self._table is not None else []
+        return table_sources + [chunk['source'] for chunk in self._rows]
+    
+    def take(self, indices: List[int]) -> "ChunkStore":
+        """New store holding only the chunks at the given positions"""
+        return ChunkStore(table=self.to_table().take(pa.array(indices, pa.int64())))
+    
+    def to_table(self) -> "pa.Table":
+        """Combine loaded and appended chunks into one table"""
+        sources = [chunk['source'] for chunk in self._rows]
+        appended = pa.table({
+            'content': pa.array([chunk['content'] for chunk in self._rows], pa.string()),
+            'source': pa.array(sources, pa.string()).dictionary_encode(),
+            'section': pa.array([chunk['section'] for chunk in self._rows], pa.int32()),
+            'chunk_id': pa.array([chunk['chunk_id'] for chunk in self._rows], pa.int32())
+        })
+        if self._table is None:
+            return appended
+        return pa.concat_tables([self._table, appended.cast(self._table.schema)])
+    
+    @classmethod
+    def read(cls, path: Path) -> "ChunkStore":
+        return cls(table=pq.read_table(str(path), memory_map=True))
+    
+    def write(self, path: Path):
+        """Write all chunks to a Parquet file and reload from the combined table"""
+        table = self.to_table()
+        tmp_path = path.with_name(path.name + '.tmp')
+        pq.write_table(table, str(tmp_path))
+        os.replace(tmp_path, path)
+        self.__init__(table=table)
+
 class EmbeddingDB:
     """Vector database for storing and searching Lean 4 documentation"""
     
@@ -29,22 +140,71 @@ class EmbeddingDB:
         self.chunk_size = int(os.getenv('CHUNK_SIZE', 1000))
         self.overlap_size = int(os.getenv('OVERLAP_SIZE', 200))
         
-        self.chunks_file = self.db_dir / "chunks.pkl"
+        self.embedding_concurrency = int(os.getenv('EMBEDDING_CONCURRENCY', 16))
+        self.max_retries = int(os.getenv('MAX_RETRIES', 3))
+        self.retry_delay = float(os.getenv('RETRY_DELAY', 1.0))
+        
+        self.chunks_file = self.db_dir / "chunks.parquet"
+        self.legacy_chunks_file = self.db_dir / "chunks.pkl"
         self.embeddings_file = self.db_dir / "embeddings.npy"
+        self.scales_file = self.db_dir / "embedding_scales.npy"
         self.metadata_file = self.db_dir / "metadata.json"
+        self.index_file = self.db_dir / "hnsw.bin"
+        
+        # Raw embeddings keyed by sha256(text) and model, so identical text is never re-embedded
+        self._emb_cache_lock = threading.Lock()
+        self._emb_cache = sqlite3.connect(str(self.db_dir / "emb_cache.sqlite"), check_same_thread=False)
+        self._emb_cache.execute(
+            "CREATE TABLE IF NOT EXISTS emb (h BLOB, model TEXT, vec BLOB, PRIMARY KEY (h, model))"
+        )
+        self._emb_cache.commit()
+        
+        # Stored vectors are unit length float16, or int8 codes with a per-row scale
+        self.embedding_dtype = os.getenv('EMBEDDING_DTYPE', 'float16')
+        if self.embedding_dtype not in ('float16', 'int8'):
+            raise ValueError(f"Unsupported EMBEDDING_DTYPE: {self.embedding_dtype}")
+        self.embedding_scales = None
+        
+        # Recent unit-length query embeddings, in front of the SQLite cache
+        self.query_embedding_cache_size = 4096
+        self._query_embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
+        
+        # HNSW index is only used once the corpus is large enough to benefit
+        self.ann_min_elements = int(os.getenv('ANN_MIN_ELEMENTS', 10000))
+        self.hnsw_m = int(os.getenv('HNSW_M', 32))
+        self.hnsw_ef_construction = int(os.getenv('HNSW_EF_CONSTRUCTION', 200))
+        self.hnsw_ef_search = int(os.getenv('HNSW_EF_SEARCH', 64))
+        self.index = None
+        self.scan_block_rows = 4096
+        
+        # Search caches: exact (query, k) rankings in memory and on disk,
+        # then LSH buckets of near-duplicate query embeddings
+        self.query_cache_size = int(os.getenv('QUERY_CACHE_SIZE', 1024))
+        self.search_cache_file = self.db_dir / "search_cache"
+        self._search_cache_lock = threading.Lock()
+        self._search_cached = functools.lru_cache(maxsize=self.query_cache_size)(self._search_ranked)
+        self.lsh_bits = 16
+        self.lsh_threshold = float(os.getenv('LSH_SIMILARITY', 0.97))
+        self.lsh_bucket_size = 16
+        self._lsh_planes = None
+        self._lsh: Dict[int, List[Tuple[np.ndarray, np.ndarray, np.ndarray]]] = {}
         
         # Load existing database or create new one
         self.chunks = []
         self.embeddings = None
         self.metadata = {}
+        # (mtime, size, sha256) of each source file as of when it was embedded
+        self.file_states: Dict[str, Dict] = {}
         self._load_or_create_db()
     
     def _load_or_create_db(self):
         """Load existing database or create new one from documents"""
-        if (self.chunks_file.exists() and 
+        if ((self.chunks_file.exists() or self.legacy_chunks_file.exists()) and 
             self.embeddings_file.exists() and 
             self.metadata_file.exists()):
-            self._load_db()
+            if self._load_db():
+                self._refresh_documents()
         else:
             print("Creating new embedding database...")
             self._create_db()
@@ -52,18 +212,41 @@ class EmbeddingDB:
     def _load_db(self):
         """Load existing database"""
         try:
-            with open(self.chunks_file, 'rb') as f:
-                self.chunks = pickle.load(f)
+            if pq is not None and self.chunks_file.exists():
+                self.chunks = ChunkStore.read(self.chunks_file)
+            else:
+                with open(self.legacy_chunks_file, 'rb') as f:
+                    self.chunks = pickle.load(f)
+            
+            # Map the stored vectors instead of reading them into memory
+            self.embeddings = np.load(self.embeddings_file, mmap_mode='r')
+            self.embedding_scales = None
+            if self.embeddings.dtype == np.int8:
+                self.embedding_scales = np.load(self.scales_file)
+            elif self.embeddings.dtype != np.float16:
+                # Older databases were saved unnormalized and as float64
+                self.embeddings = _normalize_rows(
+                    np.asarray(self.embeddings, dtype=np.float32)
+                ).astype(np.float16)
             
-            self.embeddings = np.load(self.embeddings_file)
+            if self.embeddings.dtype != np.dtype(self.embedding_dtype):
+                # Saved with the other EMBEDDING_DTYPE; convert once and persist
+                self.embeddings, self.embedding_scales = self._encode_embeddings(
+                    self._decode_embeddings(0, len(self.embeddings))
+                )
+                self._save_embeddings()
             
             with open(self.metadata_file, 'r') as f:
                 self.metadata = json.load(f)
             
+            self._load_index()
+            
             print(f"Loaded database with {len(self.chunks)} chunks")
+            return True
         except Exception as e:
             print(f"Error loading database: {e}")
             self._create_db()
+            return False
     
     def _create_db(self):
         """Create new database from documents directory"""
@@ -71,17 +254,22 @@ class EmbeddingDB:
         self.documents_dir.mkdir(exist_ok=True)
         
         # Process documents
+        self.file_states = {}
         documents = self._load_documents()
         if not documents:
             print("No documents found, creating with default Lean 4 content")
-            documents = self._create_default_documents()
+            self._create_default_documents()
+            # Reload so chunk sources match the files tracked for later refreshes
+            documents = self._load_documents()
         
         # Split into chunks
         self.chunks = self._split_documents(documents)
         
         if self.chunks:
             # Generate embeddings
-            self.embeddings = self._generate_embeddings(self.chunks)
+            self.embeddings, self.embedding_scales = self._encode_embeddings(
+                self._generate_embeddings(self.chunks)
+            )
             
             # Save database
             self._save_db()
@@ -94,28 +282,137 @@ class EmbeddingDB:
         documents = []
         
         for file_path in self.documents_dir.glob("*.txt"):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Split by <EOC> tag if present
-                if '<EOC>' in content:
-                    sections = content.split('<EOC>')
-                else:
-                    sections = [content]
-                
-                for i, section in enumerate(sections):
-                    if section.strip():
-                        documents.append({
-                            'content': section.strip(),
-                            'source': str(file_path),
-                            'section': i
-                        })
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
+            documents.extend(self._load_file(file_path))
+        
+        return documents
+    
+    def _load_file(self, file_path: Path) -> List[Dict]:
+        """Load one document file's sections and record its state"""
+        documents = []
+        try:
+            stat = file_path.stat()
+            with open(file_path, 'rb') as f:
+                raw = f.read()
+            content = raw.decode('utf-8')
+            
+            self.file_states[str(file_path)] = {
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'sha256': hashlib.sha256(raw).hexdigest()
+            }
+            
+            # Split by <EOC> tag if present
+            if '<EOC>' in content:
+                sections = content.split('<EOC>')
+            else:
+                sections = [content]
+            
+            for i, section in enumerate(sections):
+                if section.strip():
+                    documents.append({
+                        'content': section.strip(),
+                        'source': str(file_path),
+                        'section': i
+                    })
+        except Exception as e:
+            print(f"Error loading {file_path}: {e}")
         
         return documents
     
+    def _source_rows(self) -> Dict[str, List[int]]:
+        """Row indices of the chunks belonging to each source"""
+        sources = self.chunks.sources() if isinstance(self.chunks, ChunkStore) else [
+            chunk['source'] for chunk in self.chunks
+        ]
+        rows: Dict[str, List[int]] = {}
+        for i, source in enumerate(sources):
+            rows.setdefault(source, []).append(i)
+        return rows
+    
+    def _refresh_documents(self):
+        """
+        Bring a loaded database up to date with the documents directory
+        
+        Only files whose size or mtime changed are re-hashed, and only files
+        whose content changed are re-embedded. Chunks of removed files are dropped.
+        """
+        tracked = self.metadata.get('files')
+        metadata_stale = tracked is None or self.metadata.get('embedding_dtype') != self.embedding_dtype
+        if tracked is None:
+            # Databases saved before file tracking: assume their sources are current
+            source_rows = self._source_rows()
+            tracked = {}
+            for source, rows in source_rows.items():
+                path = Path(source)
+                if path.is_file():
+                    stat = path.stat()
+                    tracked[source] = {
+                        'mtime': stat.st_mtime,
+                        'size': stat.st_size,
+                        'sha256': hashlib.sha256(path.read_bytes()).hexdigest(),
+                        'chunk_ids': rows
+                    }
+        
+        self.file_states = {
+            path: {key: info[key] for key in ('mtime', 'size', 'sha256')}
+            for path, info in tracked.items()
+        }
+        
+        current = {str(path): path for path in self.documents_dir.glob("*.txt")}
+        stale_rows = []
+        to_load = []
+        for path, info in tracked.items():
+            file_path = current.get(path)
+            if file_path is None:
+                stale_rows.extend(info['chunk_ids'])
+                del self.file_states[path]
+                continue
+            
+            stat = file_path.stat()
+            if stat.st_mtime == info['mtime'] and stat.st_size == info['size']:
+                continue
+            
+            digest = hashlib.sha256(file_path.read_bytes()).hexdigest()
+            if digest == info['sha256']:
+                # Touched but unchanged
+                self.file_states[path]['mtime'] = stat.st_mtime
+                metadata_stale = True
+                continue
+            
+            stale_rows.extend(info['chunk_ids'])
+            to_load.append(file_path)
+        
+        to_load.extend(file_path for path, file_path in current.items() if path not in tracked)
+        
+        if not stale_rows and not to_load:
+            if metadata_stale:
+                self._save_metadata()
+            return
+        
+        print(f"Updating embedding database: {len(to_load)} new or changed files, "
+              f"{len(stale_rows)} stale chunks")
+        
+        if stale_rows:
+            keep = np.setdiff1d(np.arange(len(self.chunks)), stale_rows)
+            if isinstance(self.chunks, ChunkStore):
+                self.chunks = self.chunks.take(keep.tolist())
+            else:
+                self.chunks = [self.chunks[i] for i in keep]
+            self.embeddings = np.delete(self.embeddings, stale_rows, axis=0)
+            if self.embedding_scales is not None:
+                self.embedding_scales = np.delete(self.embedding_scales, stale_rows)
+            # Row positions shifted, so the index must be rebuilt
+            self.index = None
+        
+        new_chunks = self._split_documents(
+            [doc for file_path in to_load for doc in self._load_file(file_path)]
+        )
+        if new_chunks:
+            self.chunks.extend(new_chunks)
+            self._append_embeddings(self._generate_embeddings(new_chunks))
+        
+        self._save_db()
+    
     def _create_default_documents(self) -> List[Dict]:
         """Create default Lean 4 documentation"""
         default_docs = [
@@ -187,70 +484,417 @@ theorem modus_ponens (P Q : Prop) (hpq : P → Q) (hp : P) : Q := by
     def _split_documents(self, documents: List[Dict]) -> List[Dict]:
         """Split documents into chunks"""
         chunks = []
+        step = self.chunk_size - self.overlap_size
         
         for doc in documents:
             content = doc['content']
             
             # Simple chunking by character count
-            for i in range(0, len(content), self.chunk_size - self.overlap_size):
-                chunk_content = content[i:i + self.chunk_size]
-                
-                if chunk_content.strip():
-                    chunks.append({
-                        'content': chunk_content,
-                        'source': doc['source'],
-                        'section': doc['section'],
-                        'chunk_id': len(chunks)
-                    })
+            pieces = [content[i:i + self.chunk_size] for i in range(0, len(content), step)]
+            chunks.extend(
+                {
+                    'content': piece,
+                    'source': doc['source'],
+                    'section': doc['section'],
+                    'chunk_id': chunk_id
+                }
+                for chunk_id, piece in enumerate(
+                    (p for p in pieces if p and not p.isspace()), start=len(chunks)
+                )
+            )
         
         return chunks
     
     def _generate_embeddings(self, chunks: List[Dict]) -> np.ndarray:
-        """Generate embeddings for chunks"""
+        """Generate embeddings for chunks, with several batches in flight at once"""
         print(f"Generating embeddings for {len(chunks)} chunks...")
         
-        embeddings = []
+        texts = [chunk['content'] for chunk in chunks]
+        embeddings = self._lookup_embeddings(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if len(missing) < len(texts):
+            print(f"Reused {len(texts) - len(missing)} cached embeddings")
+        
         batch_size = 100
+        batches = [
+            [texts[i] for i in missing[start:start + batch_size]]
+            for start in range(0, len(missing), batch_size)
+        ]
+        
+        batch_embeddings = _run_coroutine(self._aembed_batches(batches, len(missing)))
         
-        for i in range(0, len(chunks), batch_size):
-            batch = chunks[i:i + batch_size]
-            texts = [chunk['content'] for chunk in batch]
+        new_entries = []
+        for start, batch, vectors in zip(range(0, len(missing), batch_size), batches, batch_embeddings):
+            if vectors is None:
+                # Add zero embeddings as fallback (not cached)
+                vectors = [np.zeros(1536, dtype=np.float32)] * len(batch)  # Default embedding size
+            else:
+                vectors = [np.asarray(v, dtype=np.float32) for v in vectors]
+                new_entries.extend(zip(batch, vectors))
+            for i, vector in zip(missing[start:start + batch_size], vectors):
+                embeddings[i] = vector
+        
+        self._store_embeddings(new_entries)
+        
+        return _normalize_rows(np.array(embeddings, dtype=np.float32))
+    
+    def _embed_query(self, query: str) -> np.ndarray:
+        """Unit-length embedding for a search query, via the embedding cache"""
+        return self._embed_queries([query])[0]
+    
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Unit-length embeddings for several queries, with one API call for all cache misses"""
+        with self._query_embeddings_lock:
+            known = {}
+            for query in queries:
+                if query in self._query_embeddings:
+                    self._query_embeddings.move_to_end(query)
+                    known[query] = self._query_embeddings[query]
+        
+        unknown = [q for q in dict.fromkeys(queries) if q not in known]
+        if unknown:
+            embeddings = self._lookup_embeddings(unknown)
+            missing = [q for q, e in zip(unknown, embeddings) if e is None]
+            if missing:
+                response = self.client.embeddings.create(
+                    model=self.embedding_model,
+                    input=missing
+                )
+                fetched = {
+                    query: np.asarray(data.embedding, dtype=np.float32)
+                    for query, data in zip(missing, response.data)
+                }
+                self._store_embeddings(list(fetched.items()))
+                embeddings = [fetched[q] if e is None else e for q, e in zip(unknown, embeddings)]
             
+            normalized = _normalize_rows(np.array(embeddings, dtype=np.float32))
+            with self._query_embeddings_lock:
+                for query, embedding in zip(unknown, normalized):
+                    known[query] = embedding
+                    self._query_embeddings[query] = embedding
+                while len(self._query_embeddings) > self.query_embedding_cache_size:
+                    self._query_embeddings.popitem(last=False)
+        
+        return np.array([known[q] for q in queries], dtype=np.float32)
+    
+    @staticmethod
+    def _text_hash(text: str) -> bytes:
+        return hashlib.sha256(text.encode('utf-8')).digest()
+    
+    def _lookup_embeddings(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Fetch cached raw embeddings for texts, None where missing"""
+        hashes = [self._text_hash(text) for text in texts]
+        found = {}
+        with self._emb_cache_lock:
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                rows = self._emb_cache.execute(
+                    f"SELECT h, vec FROM emb WHERE model = ? AND h IN ({','.join('?' * len(part))})",
+                    [self.embedding_model, *part]
+                ).fetchall()
+                found.update(rows)
+        
+        return [
+            np.frombuffer(found[h], dtype=np.float32) if h in found else None
+            for h in hashes
+        ]
+    
+    def _store_embeddings(self, entries: List[Tuple[str, np.ndarray]]):
+        """Cache raw embeddings for texts"""
+        if not entries:
+            return
+        
+        with self._emb_cache_lock:
+            self._emb_cache.executemany(
+                "INSERT OR REPLACE INTO emb (h, model, vec) VALUES (?, ?, ?)",
+                [
+                    (self._text_hash(text), self.embedding_model,
+                     np.asarray(vector, dtype=np.float32).tobytes())
+                    for text, vector in entries
+                ]
+            )
+            self._emb_cache.commit()
+    
+    async def _aembed_batches(self, batches: List[List[str]], total: int) -> List[Optional[List[List[float]]]]:
+        """Embed all batches concurrently, returning results (None for failed batches) in batch order"""
+        semaphore = asyncio.Semaphore(self.embedding_concurrency)
+        async_client = openai.AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        processed = 0
+        
+        async def embed(batch_index: int, texts: List[str]) -> Optional[List[List[float]]]:
+            nonlocal processed
+            async with semaphore:
+                embeddings = await self._aembed_batch(async_client, batch_index, texts)
+            processed += len(texts)
+            print(f"Processed {processed}/{total} chunks")
+            return embeddings
+        
+        try:
+            return await asyncio.gather(*[embed(i, texts) for i, texts in enumerate(batches)])
+        finally:
+            await async_client.close()
+    
+    async def _aembed_batch(self, async_client: "openai.AsyncOpenAI",
+                            batch_index: int, texts: List[str]) -> Optional[List[List[float]]]:
+        """Embed one batch with exponential backoff, returning None if every attempt fails"""
+        for attempt in range(self.max_retries):
             try:
-                response = self.client.embeddings.create(
+                response = await async_client.embeddings.create(
                     model=self.embedding_model,
                     input=texts
                 )
-                
-                batch_embeddings = [data.embedding for data in response.data]
-                embeddings.extend(batch_embeddings)
-                
-                print(f"Processed {min(i + batch_size, len(chunks))}/{len(chunks)} chunks")
-                
+                return [data.embedding for data in response.data]
             except Exception as e:
-                print(f"Error generating embeddings for batch {i}: {e}")
-                # Add zero embeddings as fallback
-                batch_embeddings = [[0.0] * 1536] * len(batch)  # Default embedding size
-                embeddings.extend(batch_embeddings)
+                if attempt == self.max_retries - 1:
+                    print(f"Error generating embeddings for batch {batch_index}: {e}")
+                    return None
+                await asyncio.sleep(self.retry_delay * (2 ** attempt))  # Exponential backoff
+    
+    def _encode_embeddings(self, matrix: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Unit-length float32 rows in the configured storage dtype, with int8 scales"""
+        if self.embedding_dtype == 'int8':
+            return _quantize_rows(matrix)
+        return matrix.astype(np.float16), None
+    
+    def _decode_embeddings(self, start: int, stop: int) -> np.ndarray:
+        """Stored rows [start, stop) as float32"""
+        rows = np.asarray(self.embeddings[start:stop], dtype=np.float32)
+        if self.embedding_scales is not None:
+            rows *= self.embedding_scales[start:stop, None]
+        return rows
+    
+    def _append_embeddings(self, matrix: np.ndarray):
+        """Encode new unit-length rows and append them to the stored embeddings"""
+        codes, scales = self._encode_embeddings(matrix)
+        if self.embeddings is None:
+            self.embeddings, self.embedding_scales = codes, scales
+            return
+        
+        self.embeddings = np.vstack([self.embeddings, codes])
+        if scales is not None:
+            self.embedding_scales = np.concatenate([self.embedding_scales, scales])
+    
+    def _save_embeddings(self):
+        """Write the embeddings (and int8 scales) to disk"""
+        # Write to a temporary file first: the current file may still be memory-mapped
+        tmp_file = self.embeddings_file.with_name(self.embeddings_file.name + '.tmp')
+        with open(tmp_file, 'wb') as f:
+            np.save(f, np.asarray(self.embeddings))
+        
+        if self.embedding_scales is not None:
+            tmp_scales = self.scales_file.with_name(self.scales_file.name + '.tmp')
+            with open(tmp_scales, 'wb') as f:
+                np.save(f, self.embedding_scales)
+            os.replace(tmp_scales, self.scales_file)
+        elif self.scales_file.exists():
+            self.scales_file.unlink()
         
-        return np.array(embeddings)
+        os.replace(tmp_file, self.embeddings_file)
     
     def _save_db(self):
         """Save database to disk"""
-        with open(self.chunks_file, 'wb') as f:
-            pickle.dump(self.chunks, f)
+        if pa is not None:
+            if not isinstance(self.chunks, ChunkStore):
+                self.chunks = ChunkStore(rows=self.chunks)
+            self.chunks.write(self.chunks_file)
+            # The pickle would now be stale
+            if self.legacy_chunks_file.exists():
+                self.legacy_chunks_file.unlink()
+        else:
+            with open(self.legacy_chunks_file, 'wb') as f:
+                pickle.dump(list(self.chunks), f)
+        
+        self._save_embeddings()
+        
+        self._sync_index()
+        if self.index is not None:
+            self.index.save_index(str(self.index_file))
         
-        np.save(self.embeddings_file, self.embeddings)
+        # Cached rankings refer to the previous contents
+        self._clear_query_caches()
         
+        self._save_metadata()
+    
+    def _save_metadata(self):
+        source_rows = self._source_rows()
         self.metadata = {
             'num_chunks': len(self.chunks),
             'embedding_model': self.embedding_model,
             'chunk_size': self.chunk_size,
-            'overlap_size': self.overlap_size
+            'overlap_size': self.overlap_size,
+            'embedding_dtype': self.embedding_dtype,
+            'files': {
+                path: {**state, 'chunk_ids': source_rows.get(path, [])}
+                for path, state in self.file_states.items()
+            }
         }
         
-        with open(self.metadata_file, 'w') as f:
+        tmp_file = self.metadata_file.with_name(self.metadata_file.name + '.tmp')
+        with open(tmp_file, 'w') as f:
             json.dump(self.metadata, f, indent=2)
+        os.replace(tmp_file, self.metadata_file)
+    
+    def _use_ann(self) -> bool:
+        """Whether the HNSW index should be used for the current corpus"""
+        return (hnswlib is not None and
+                self.embeddings is not None and
+                len(self.embeddings) >= self.ann_min_elements)
+    
+    def _load_index(self):
+        """Load the persisted HNSW index, rebuilding it if missing or stale"""
+        self.index = None
+        if not self._use_ann():
+            return
+        
+        if self.index_file.exists():
+            try:
+                index = hnswlib.Index(space='cosine', dim=self.embeddings.shape[1])
+                index.load_index(str(self.index_file), max_elements=len(self.embeddings))
+                if index.get_current_count() == len(self.embeddings):
+                    self.index = index
+                    return
+            except Exception as e:
+                print(f"Error loading HNSW index: {e}")
+        
+        self._sync_index()
+        self.index.save_index(str(self.index_file))
+    
+    def _sync_index(self):
+        """Build the HNSW index, or add rows appended since it was built"""
+        if not self._use_ann():
+            self.index = None
+            return
+        
+        num_elements, dim = self.embeddings.shape
+        if self.index is None:
+            self.index = hnswlib.Index(space='cosine', dim=dim)
+            self.index.init_index(
+                max_elements=num_elements,
+                M=self.hnsw_m,
+                ef_construction=self.hnsw_ef_construction
+            )
+            self.index.add_items(
+                self._decode_embeddings(0, num_elements), np.arange(num_elements)
+            )
+            return
+        
+        indexed = self.index.get_current_count()
+        if indexed < num_elements:
+            self.index.resize_index(num_elements)
+            self.index.add_items(
+                self._decode_embeddings(indexed, num_elements),
+                np.arange(indexed, num_elements)
+            )
+    
+    def _similarities(self, query_embedding: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the query against every stored chunk"""
+        # Stored embeddings are unit length float16 or int8; decode one L2-sized block at a time
+        similarities = np.empty(len(self.embeddings), dtype=np.float32)
+        block = self.scan_block_rows
+        for start in range(0, len(self.embeddings), block):
+            rows = self._decode_embeddings(start, start + block)
+            similarities[start:start + block] = rows @ query_embedding
+        return similarities
+    
+    def _top_k(self, query_embedding: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return indices and cosine similarities of the k nearest chunks, best first"""
+        k = min(k, len(self.embeddings))
+        
+        if self.index is not None:
+            self.index.set_ef(max(self.hnsw_ef_search, k))
+            labels, distances = self.index.knn_query(query_embedding, k=k)
+            return labels[0], 1.0 - distances[0]
+        
+        similarities = self._similarities(query_embedding)
+        
+        # Get top k results without sorting the whole corpus
+        top_indices = np.argpartition(similarities, -k)[-k:]
+        top_indices = top_indices[np.argsort(similarities[top_indices])[::-1]]
+        return top_indices, similarities[top_indices]
+    
+    def _top_k_many(self, query_embeddings: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Row-wise _top_k for a matrix of queries, best first in each row"""
+        k = min(k, len(self.embeddings))
+        
+        if self.index is not None:
+            self.index.set_ef(max(self.hnsw_ef_search, k))
+            labels, distances = self.index.knn_query(query_embeddings, k=k)
+            return labels, 1.0 - distances
+        
+        similarities = np.empty((len(query_embeddings), len(self.embeddings)), dtype=np.float32)
+        block = self.scan_block_rows
+        for start in range(0, len(self.embeddings), block):
+            rows = self._decode_embeddings(start, start + block)
+            similarities[:, start:start + block] = query_embeddings @ rows.T
+        
+        top_indices = np.argpartition(similarities, -k, axis=1)[:, -k:]
+        top_similarities = np.take_along_axis(similarities, top_indices, axis=1)
+        order = np.argsort(-top_similarities, axis=1)
+        return (np.take_along_axis(top_indices, order, axis=1),
+                np.take_along_axis(top_similarities, order, axis=1))
+    
+    def _lsh_key(self, query_embedding: np.ndarray) -> int:
+        """Signed random projection sketch of an embedding, packed into an int"""
+        if self._lsh_planes is None or self._lsh_planes.shape[0] != len(query_embedding):
+            rng = np.random.default_rng(0)
+            self._lsh_planes = rng.standard_normal(
+                (len(query_embedding), self.lsh_bits)
+            ).astype(np.float32)
+        
+        bits = (query_embedding @ self._lsh_planes) > 0
+        return int(np.packbits(bits).view('>u2')[0])
+    
+    def _lsh_lookup(self, query_embedding: np.ndarray, k: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Reuse the ranking of a near-duplicate earlier query, if one is cached"""
+        needed = min(k, len(self.embeddings))
+        for embedding, top_indices, similarities in self._lsh.get(self._lsh_key(query_embedding), []):
+            if len(top_indices) >= needed and float(embedding @ query_embedding) >= self.lsh_threshold:
+                return top_indices, similarities
+        return None
+    
+    def _remember_query(self, query_embedding: np.ndarray,
+                        top_indices: np.ndarray, similarities: np.ndarray):
+        """Store a query's embedding and ranking in its LSH bucket"""
+        bucket = self._lsh.setdefault(self._lsh_key(query_embedding), [])
+        bucket.insert(0, (query_embedding, top_indices, similarities))
+        del bucket[self.lsh_bucket_size:]
+    
+    def _clear_query_caches(self):
+        self._search_cached.cache_clear()
+        self._lsh.clear()
+        with self._search_cache_lock:
+            with shelve.open(str(self.search_cache_file), flag='n'):
+                pass
+    
+    def _search_ranked(self, query: str, k: int) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+        """Ranking for a query, served from the on-disk cache when present"""
+        key = f"{hashlib.sha256(query.encode('utf-8')).hexdigest()}|{k}|{len(self.chunks)}"
+        with self._search_cache_lock:
+            with shelve.open(str(self.search_cache_file)) as cache:
+                cached = cache.get(key)
+        if cached is not None:
+            return cached
+        
+        top_indices, similarities = self._search_uncached(query, k)
+        ranked = (tuple(int(i) for i in top_indices), tuple(float(s) for s in similarities))
+        
+        with self._search_cache_lock:
+            with shelve.open(str(self.search_cache_file)) as cache:
+                cache[key] = ranked
+        return ranked
+    
+    def _search_uncached(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Embed the query and rank chunks, reusing a near-duplicate query's ranking if possible"""
+        query_embedding = self._embed_query(query)
+        
+        lsh_hit = self._lsh_lookup(query_embedding, k)
+        if lsh_hit is not None:
+            top_indices, similarities = lsh_hit
+        else:
+            top_indices, similarities = self._top_k(query_embedding, k)
+            self._remember_query(query_embedding, top_indices, similarities)
+        
+        return top_indices[:k], similarities[:k]
     
     def search(self, query: str, k: int = None) -> List[Dict]:
         """Search for relevant chunks"""
@@ -261,23 +905,12 @@ theorem modus_ponens (P Q : Prop) (hpq : P → Q) (hp : P) : Q := by
             return []
         
         try:
-            # Generate query embedding
-            response = self.client.embeddings.create(
-                model=self.embedding_model,
-                input=[query]
-            )
-            query_embedding = np.array(response.data[0].embedding).reshape(1, -1)
-            
-            # Calculate similarities
-            similarities = cosine_similarity(query_embedding, self.embeddings)[0]
-            
-            # Get top k results
-            top_indices = np.argsort(similarities)[-k:][::-1]
+            top_indices, similarities = self._search_cached(query, k)
             
             results = []
-            for idx in top_indices:
+            for idx, similarity in zip(top_indices, similarities):
                 chunk = self.chunks[idx].copy()
-                chunk['similarity'] = float(similarities[idx])
+                chunk['similarity'] = similarity
                 results.append(chunk)
             
             return results
@@ -286,6 +919,45 @@ theorem modus_ponens (P Q : Prop) (hpq : P → Q) (hp : P) : Q := by
             print(f"Error during search: {e}")
             return []
     
+    def search_many(self, queries: List[str], k: Union[int, List[int]] = None) -> List[List[Dict]]:
+        """
+        Search for several queries at once
+        
+        All queries are embedded in one API call and scored against the
+        corpus with a single matrix product. Results mirror search().
+        
+        Args:
+            queries: Query strings
+            k: Number of results, either shared or one per query
+        """
+        if k is None:
+            k = int(os.getenv('MAX_CHUNKS', 10))
+        ks = list(k) if isinstance(k, (list, tuple)) else [k] * len(queries)
+        
+        if not queries:
+            return []
+        if not self.chunks or self.embeddings is None:
+            return [[] for _ in queries]
+        
+        try:
+            query_embeddings = self._embed_queries(queries)
+            top_indices, similarities = self._top_k_many(query_embeddings, max(ks))
+            
+            all_results = []
+            for row_indices, row_similarities, row_k in zip(top_indices, similarities, ks):
+                results = []
+                for idx, similarity in zip(row_indices[:row_k], row_similarities[:row_k]):
+                    chunk = self.chunks[idx].copy()
+                    chunk['similarity'] = float(similarity)
+                    results.append(chunk)
+                all_results.append(results)
+            
+            return all_results
+            
+        except Exception as e:
+            print(f"Error during search: {e}")
+            return [[] for _ in queries]
+    
     def add_document(self, content: str, source: str = "user_added"):
         """Add a new document to the database"""
         doc = {'content': content, 'source': source, 'section': 0}
@@ -296,11 +968,7 @@ theorem modus_ponens (P Q : Prop) (hpq : P → Q) (hp : P) : Q := by
             
             # Update database
             self.chunks.extend(new_chunks)
-            
-            if self.embeddings is not None:
-                self.embeddings = np.vstack([self.embeddings, new_embeddings])
-            else:
-                self.embeddings = new_embeddings
+            self._append_embeddings(new_embeddings)
             
             # Save updated database
             self._save_db()
@@ -4,21 +4,293 @@ Handles running Lean code and capturing output/errors
 """
 
 import os
+import json
+import asyncio
+import hashlib
+import queue
+import concurrent.futures
+import functools
+import logging
+import re
 import subprocess
 import tempfile
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Probed once per process; None afterwards means Lean was unavailable
+_UNPROBED = object()
+_toolchain_fingerprint = _UNPROBED
+_toolchain_lock = threading.Lock()
+
+# Most recent results by cache key, in front of the on-disk cache
+RESULT_MEMO_SIZE = 1024
+
+# The on-disk cache is pruned to its size bound once every this many writes
+CACHE_PRUNE_INTERVAL = 256
+_cache_writes = 0
+_cache_writes_lock = threading.Lock()
+_result_memo: "OrderedDict[str, Dict]" = OrderedDict()
+_result_memo_lock = threading.Lock()
+
+def toolchain_fingerprint() -> Optional[str]:
+    """
+    Identify the Lean toolchain and dependency versions in use
+    
+    Combines `lean --version` with the lake manifest so cached results are
+    invalidated by toolchain or Mathlib upgrades. Returns None if Lean is unavailable.
+    """
+    global _toolchain_fingerprint
+    with _toolchain_lock:
+        if _toolchain_fingerprint is _UNPROBED:
+            _toolchain_fingerprint = None
+            try:
+                version = subprocess.run(
+                    ['lake', 'env', 'lean', '--version'],
+                    capture_output=True,
+                    text=True,
+                    timeout=60,
+                    cwd=Path.cwd()
+                )
+            except Exception:
+                return None
+            if version.returncode != 0:
+                return None
+            
+            manifest = Path.cwd() / "lake-manifest.json"
+            manifest_hash = hashlib.sha256(manifest.read_bytes()).hexdigest() if manifest.exists() else ""
+            _toolchain_fingerprint = f"{version.stdout.strip()}|{manifest_hash}"
+        return _toolchain_fingerprint
+
+_PLACEHOLDER = re.compile(r'\{\{(code|proof)\}\}')
+_ERROR_LOCATION = re.compile(r'^.*?:(\d+):\d+: error', re.MULTILINE)
+
+# Failures caused by the build environment rather than the submitted code
+_ENVIRONMENT_ERROR = re.compile(
+    r"unknown package|unknown module prefix|object file .* does not exist|"
+    r"could not resolve|failed to load|no such file|server (?:crashed|exited)",
+    re.IGNORECASE
+)
+
+# Proofs cheap enough to check together with the implementation in one compile
+TRIVIAL_PROOFS = frozenset({'rfl', 'simp', 'omega', 'norm_num', 'ring'})
+
+def fill(template: str, code: str, proof: str) -> str:
+    """
+    Substitute code and proof into a task template's {{code}}/{{proof}} placeholders
+    
+    Unlike chained str.replace, a placeholder inside the substituted code is left alone.
+    """
+    slots = {'code': code, 'proof': proof}
+    return ''.join(
+        segment if slot is None else slots[slot]
+        for segment, slot in LeanRunner._compile_template(template)
+    )
+
+class LeanServerError(Exception):
+    """The Lean server process died or stopped responding"""
+    pass
+
+class LeanServer:
+    """
+    Minimal LSP client for a persistent `lake env lean --server` process
+    
+    Each filename stays open as a document; re-checking it sends the new
+    text as a change so the file worker keeps its elaborated imports.
+    """
+    
+    def __init__(self, cwd: Path, timeout: int):
+        self.cwd = cwd
+        self.timeout = timeout
+        self.proc = None
+        self._messages = queue.Queue()
+        self._next_id = 0
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def start(self):
+        """Launch the server and complete the LSP handshake"""
+        self.proc = subprocess.Popen(
+            ['lake', 'env', 'lean', '--server'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=self.cwd
+        )
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        
+        request_id = self._request('initialize', {
+            'processId': os.getpid(),
+            'rootUri': self.cwd.resolve().as_uri(),
+            'capabilities': {}
+        })
+        self._wait_for_response(request_id, time.monotonic() + self.timeout)
+        self._notify('initialized', {})
+    
+    def close(self):
+        """Stop the server process"""
+        if self.proc is None:
+            return
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+        self.proc = None
+        self._versions = {}
+    
+    def check(self, lean_code: str, file_path: Path) -> Dict:
+        """
+        Elaborate a file and return its diagnostics in execute_lean_code's format
+        
+        Raises:
+            LeanServerError: if the server is not usable
+            TimeoutError: if elaboration exceeds the timeout
+        """
+        with self._lock:
+            if self.proc is None or self.proc.poll() is not None:
+                raise LeanServerError("Lean server is not running")
+            
+            uri = file_path.resolve().as_uri()
+            version = self._versions.get(uri, 0) + 1
+            if version == 1:
+                self._notify('textDocument/didOpen', {
+                    'textDocument': {'uri': uri, 'languageId': 'lean4', 'version': version, 'text': lean_code}
+                })
+            else:
+                self._notify('textDocument/didChange', {
+                    'textDocument': {'uri': uri, 'version': version},
+                    'contentChanges': [{'text': lean_code}]
+                })
+            self._versions[uri] = version
+            
+            request_id = self._request('textDocument/waitForDiagnostics', {'uri': uri, 'version': version})
+            diagnostics = self._wait_for_response(request_id, time.monotonic() + self.timeout, uri)
+            
+            return self._to_result(diagnostics, file_path)
+    
+    def _to_result(self, diagnostics: List[Dict], file_path: Path) -> Dict:
+        """Render diagnostics the way the lean command line prints them"""
+        severities = {1: 'error', 2: 'warning', 3: 'information', 4: 'hint'}
+        messages = []
+        errors = []
+        for diagnostic in diagnostics:
+            start = diagnostic['range']['start']
+            severity = severities.get(diagnostic.get('severity', 1), 'error')
+            message = f"{file_path}:{start['line'] + 1}:{start['character']}: {severity}: {diagnostic['message']}"
+            messages.append(message)
+            if severity == 'error':
+                errors.append(message)
+        
+        return {
+            'success': not errors,
+            'output': "\n".join(messages),
+            'error': "\n".join(errors),
+            'returncode': 1 if errors else 0
+        }
+    
+    def _send(self, payload: Dict):
+        body = json.dumps(payload).encode('utf-8')
+        try:
+            self.proc.stdin.write(f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError, AttributeError) as e:
+            raise LeanServerError(f"Failed to write to Lean server: {e}")
+    
+    def _request(self, method: str, params: Dict) -> int:
+        self._next_id += 1
+        self._send({'jsonrpc': '2.0', 'id': self._next_id, 'method': method, 'params': params})
+        return self._next_id
+    
+    def _notify(self, method: str, params: Dict):
+        self._send({'jsonrpc': '2.0', 'method': method, 'params': params})
+    
+    def _wait_for_response(self, request_id: int, deadline: float, uri: str = None) -> List[Dict]:
+        """Read messages until the response to request_id, collecting diagnostics for uri"""
+        diagnostics = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError()
+            try:
+                message = self._messages.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError()
+            
+            if message is None:
+                raise LeanServerError("Lean server exited")
+            
+            if message.get('id') == request_id and 'method' not in message:
+                if 'error' in message:
+                    raise LeanServerError(f"Lean server error: {message['error']}")
+                return diagnostics
+            
+            if 'id' in message and 'method' in message:
+                # Server-to-client request; we support none of them
+                self._send({'jsonrpc': '2.0', 'id': message['id'], 'result': None})
+            elif message.get('method') == 'textDocument/publishDiagnostics':
+                params = message.get('params', {})
+                if params.get('uri') == uri:
+                    # Each notification carries the full current set
+                    diagnostics = params.get('diagnostics', [])
+    
+    def _read_loop(self):
+        """Parse Content-Length framed messages from the server into the queue"""
+        stdout = self.proc.stdout
+        try:
+            while True:
+                content_length = None
+                while True:
+                    line = stdout.readline()
+                    if not line:
+                        return
+                    line = line.strip()
+                    if not line:
+                        break
+                    name, _, value = line.decode('ascii').partition(':')
+                    if name.lower() == 'content-length':
+                        content_length = int(value.strip())
+                
+                if content_length is None:
+                    continue
+                self._messages.put(json.loads(stdout.read(content_length)))
+        except Exception:
+            pass
+        finally:
+            self._messages.put(None)
+
 class LeanRunner:
     """Handles execution of Lean 4 code"""
     
-    def __init__(self, playground_dir: str = "lean_playground"):
+    def __init__(self, playground_dir: str = "lean_playground", cache_dir: str = None):
         self.playground_dir = Path(playground_dir)
         self.playground_dir.mkdir(exist_ok=True)
         self.timeout = int(os.getenv('LEAN_TIMEOUT', 60))
+        
+        # Results are cached by source text, so identical retries skip Lean entirely
+        self.use_cache = os.getenv('LEAN_CACHE', '1') == '1'
+        self.cache_dir = Path(cache_dir) if cache_dir else self.playground_dir / ".cache"
+        self.cache_max_entries = int(os.getenv('LEAN_CACHE_MAX_ENTRIES', 10000))
+        
+        # Keep one Lean server alive across calls so imports are loaded once
+        self.use_server = os.getenv('LEAN_USE_SERVER', '1') == '1'
+        self.server = None
+        # Guards starting and replacing the server when called from several threads
+        self._server_lock = threading.Lock()
+        
+        # Without the server, pipe code to `lean --stdin` unless file names are needed in messages
+        self.use_stdin = os.getenv('LEAN_USE_STDIN', '1') == '1'
+        
+        # Worker runners for parallel checks, each with its own playground and server
+        self.max_workers = int(os.getenv('LEAN_WORKERS', 2))
+        self.pool = LeanWorkerPool(self.playground_dir, self.cache_dir, self.max_workers)
     
     def execute_lean_code(self, lean_code: str, filename: str = "TempTest.lean") -> Dict:
         """
@@ -31,21 +303,142 @@ class LeanRunner:
         Returns:
             Dict with 'success', 'output', 'error' fields
         """
+        cache_key = self._cache_key(lean_code, filename) if self.use_cache else None
+        if cache_key:
+            cached = self._memo_get(cache_key)
+            if cached is None:
+                cached = self._read_cache(cache_key)
+                if cached is not None:
+                    self._memo_put(cache_key, cached)
+            if cached is not None:
+                return dict(cached)
+        
+        result = self._execute_uncached(lean_code, filename)
+        
+        if cache_key and self._cacheable(lean_code, result):
+            self._write_cache(cache_key, result)
+            self._memo_put(cache_key, dict(result))
+        
+        return result
+    
+    @staticmethod
+    def _cacheable(lean_code: str, result: Dict) -> bool:
+        """Whether a result depends only on the code, so it may be cached"""
+        if result['success']:
+            return True
+        
+        # Timeouts and launch failures are not properties of the code
+        if result['returncode'] == -1:
+            return False
+        
+        # Only failures with located errors outside the imports; a broken
+        # build (missing oleans, unknown packages) must be retried once fixed
+        text = f"{result.get('error', '')}\n{result.get('output', '')}"
+        error_lines = [int(line) for line in _ERROR_LOCATION.findall(text)]
+        if not error_lines or _ENVIRONMENT_ERROR.search(text):
+            return False
+        source_lines = lean_code.splitlines()
+        return not any(
+            line > len(source_lines) or source_lines[line - 1].lstrip().startswith('import ')
+            for line in error_lines
+        )
+    
+    @staticmethod
+    def _memo_get(cache_key: str) -> Optional[Dict]:
+        with _result_memo_lock:
+            result = _result_memo.get(cache_key)
+            if result is not None:
+                _result_memo.move_to_end(cache_key)
+            return result
+    
+    @staticmethod
+    def _memo_put(cache_key: str, result: Dict):
+        with _result_memo_lock:
+            _result_memo[cache_key] = result
+            _result_memo.move_to_end(cache_key)
+            while len(_result_memo) > RESULT_MEMO_SIZE:
+                _result_memo.popitem(last=False)
+    
+    def _cache_key(self, lean_code: str, filename: str) -> Optional[str]:
+        fingerprint = toolchain_fingerprint()
+        if fingerprint is None:
+            return None
+        payload = '\0'.join((fingerprint, filename, lean_code))
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def _read_cache(self, cache_key: str) -> Optional[Dict]:
+        cache_file = self.cache_dir / f"{cache_key}.json"
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            # The mtime doubles as last-use time for pruning
+            os.utime(cache_file)
+            return result
+        except (OSError, ValueError):
+            return None
+    
+    def _write_cache(self, cache_key: str, result: Dict):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            cache_file = self.cache_dir / f"{cache_key}.json"
+            tmp_file = cache_file.with_name(f"{cache_key}.{threading.get_ident()}.tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(result, f)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logger.warning("Could not cache Lean result: %s", e)
+            return
+        
+        global _cache_writes
+        with _cache_writes_lock:
+            _cache_writes += 1
+            prune = _cache_writes % CACHE_PRUNE_INTERVAL == 0
+        if prune:
+            self._prune_cache()
+    
+    def _prune_cache(self):
+        """Delete the least recently used cached results beyond cache_max_entries"""
+        try:
+            with os.scandir(self.cache_dir) as it:
+                entries = [
+                    (entry.stat().st_mtime, entry.path)
+                    for entry in it if entry.name.endswith('.json')
+                ]
+        except OSError:
+            return
+        
+        excess = len(entries) - self.cache_max_entries
+        if excess <= 0:
+            return
+        entries.sort()
+        for _, path in entries[:excess]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+    
+    def _execute_uncached(self, lean_code: str, filename: str) -> Dict:
+        """Run Lean on the code via the persistent server or a subprocess"""
         file_path = self.playground_dir / filename
         
+        if self.use_server:
+            result = self._execute_on_server(lean_code, file_path)
+            if result is not None:
+                return result
+        
         try:
-            # Write code to file
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(lean_code)
-            
-            # Execute with Lake
-            result = subprocess.run(
-                ['lake', 'lean', str(file_path)],
-                capture_output=True,
-                text=True,
-                timeout=self.timeout,
-                cwd=Path.cwd()  # Run from project root where lakefile.lean is
-            )
+            if self.use_stdin:
+                # Pipe the source straight to Lean; no file is written
+                result = subprocess.run(
+                    ['lake', 'env', 'lean', '--stdin'],
+                    input=lean_code,
+                    capture_output=True,
+                    text=True,
+                    timeout=self.timeout,
+                    cwd=Path.cwd()  # Run from project root where lakefile.lean is
+                )
+            else:
+                result = self._execute_file(lean_code, file_path)
             
             success = result.returncode == 0
             output = result.stdout if result.stdout else ""
@@ -72,13 +465,155 @@ class LeanRunner:
                 'error': f"Execution failed: {str(e)}",
                 'returncode': -1
             }
+    
+    def _execute_file(self, lean_code: str, file_path: Path) -> subprocess.CompletedProcess:
+        """Run Lean on a temporary file, so messages reference its name"""
+        try:
+            # Write code to file
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(lean_code)
+            
+            # Execute with Lake
+            return subprocess.run(
+                ['lake', 'lean', str(file_path)],
+                capture_output=True,
+                text=True,
+                timeout=self.timeout,
+                cwd=Path.cwd()  # Run from project root where lakefile.lean is
+            )
         finally:
             # Clean up temporary file
-            if file_path.exists():
+            try:
+                file_path.unlink()
+            except FileNotFoundError:
+                pass
+    
+    def _execute_on_server(self, lean_code: str, file_path: Path) -> Optional[Dict]:
+        """Check code on the persistent server, or return None to fall back to a subprocess"""
+        with self._server_lock:
+            if not self.use_server:
+                return None
+            if self.server is None:
+                server = LeanServer(Path.cwd(), self.timeout)
                 try:
-                    file_path.unlink()
-                except:
-                    pass
+                    server.start()
+                except Exception as e:
+                    logger.warning("Could not start Lean server, using subprocesses: %s", e)
+                    server.close()
+                    self.use_server = False
+                    return None
+                self.server = server
+            server = self.server
+        
+        try:
+            return server.check(lean_code, file_path)
+        except TimeoutError:
+            # The server is still busy with this file; start fresh next time
+            self._close_server(server)
+            return {
+                'success': False,
+                'output': "",
+                'error': f"Execution timed out after {self.timeout} seconds",
+                'returncode': -1
+            }
+        except Exception as e:
+            logger.warning("Lean server failed, falling back to subprocess: %s", e)
+            self._close_server(server)
+            return None
+    
+    def execute_many(self, codes: List[str], filename: str = "TempTest.lean") -> List[Dict]:
+        """
+        Execute several Lean files in parallel
+        
+        Args:
+            codes: Lean sources to check
+            filename: File name used inside each worker's playground
+            
+        Returns:
+            Result dicts in the same order as codes
+        """
+        if not codes:
+            return []
+        
+        # Lean does the work in child processes, so threads are enough to run them in parallel
+        num_workers = min(self.max_workers, len(codes))
+        
+        def run(lean_code: str) -> Dict:
+            return self.pool.run(LeanRunner.execute_lean_code, lean_code, filename)
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            return list(executor.map(run, codes))
+    
+    def _close_server(self, server: Optional["LeanServer"] = None):
+        """
+        Shut down this runner's own Lean server, leaving the worker pool running
+        
+        If server is given, it is only shut down while it is still the current
+        one, so a replacement started by another thread is left alone.
+        """
+        with self._server_lock:
+            if self.server is None or (server is not None and server is not self.server):
+                return
+            self.server.close()
+            self.server = None
+    
+    def close(self):
+        """Shut down the persistent Lean server and any worker runners"""
+        self._close_server()
+        self.pool.close()
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _compile_template(template: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+        """Split a template into literal segments and placeholder slot names"""
+        segments = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(template):
+            segments.append((template[position:match.start()], None))
+            segments.append(('', match.group(1)))
+            position = match.end()
+        segments.append((template[position:], None))
+        return tuple(segments)
+    
+    def locate_error(self, task_template: str, code: str, proof: str, result: Dict) -> Optional[str]:
+        """
+        Attribute a failed full-solution compile to the implementation or the proof
+        
+        Args:
+            task_template: The Lean template with placeholders
+            code: The implementation code
+            proof: The proof code
+            result: Result of test_full_solution for the same inputs
+            
+        Returns:
+            'implementation' if any error is inside the code, 'proof' if every
+            error is inside the proof, otherwise None (e.g. errors in the template)
+        """
+        error_lines = [
+            int(line) for line in
+            _ERROR_LOCATION.findall(f"{result.get('error', '')}\n{result.get('output', '')}")
+        ]
+        if not error_lines:
+            return None
+        
+        # 1-based line ranges covered by each substituted slot
+        spans = {'code': [], 'proof': []}
+        slots = {'code': code, 'proof': proof}
+        line = 1
+        for segment, slot in self._compile_template(task_template):
+            text = segment if slot is None else slots[slot]
+            if slot is not None:
+                spans[slot].append((line, line + text.count('\n')))
+            line += text.count('\n')
+        
+        def inside(slot: str, error_line: int) -> bool:
+            return any(start <= error_line <= end for start, end in spans[slot])
+        
+        if any(inside('code', error_line) for error_line in error_lines):
+            return 'implementation'
+        if all(inside('proof', error_line) for error_line in error_lines):
+            return 'proof'
+        return None
     
     def test_implementation_only(self, task_template: str, code: str) -> Dict:
         """
@@ -91,9 +626,7 @@ class LeanRunner:
         Returns:
             Execution result dict
         """
-        # Replace placeholders with code and sorry
-        test_code = task_template.replace('{{code}}', code)
-        test_code = test_code.replace('{{proof}}', 'sorry')
+        test_code = fill(task_template, code, 'sorry')
         
         return self.execute_lean_code(test_code, "ImplementationTest.lean")
     
@@ -109,9 +642,7 @@ class LeanRunner:
         Returns:
             Execution result dict
         """
-        # Replace placeholders with actual code and proof
-        full_code = task_template.replace('{{code}}', code)
-        full_code = full_code.replace('{{proof}}', proof)
+        full_code = fill(task_template, code, proof)
         
         return self.execute_lean_code(full_code, "FullSolutionTest.lean")
     
@@ -133,10 +664,74 @@ import Aesop
 """
         return self.execute_lean_code(test_template, "SyntaxTest.lean")
 
+class LeanWorkerPool:
+    """
+    Warm LeanRunners handed out to one caller at a time
+    
+    Runners are created on demand up to `size`, each with its own playground
+    subdirectory and Lean server; results are cached in the shared cache_dir.
+    """
+    
+    def __init__(self, playground_dir: Path, cache_dir: Path, size: int):
+        self.playground_dir = Path(playground_dir)
+        self.cache_dir = Path(cache_dir)
+        self.size = max(1, size)
+        self._runners: List[LeanRunner] = []
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+    
+    def _acquire(self) -> LeanRunner:
+        with self._lock:
+            if self._idle.empty() and len(self._runners) < self.size:
+                runner = LeanRunner(
+                    str(self.playground_dir / f"worker_{len(self._runners)}"),
+                    cache_dir=str(self.cache_dir)
+                )
+                self._runners.append(runner)
+                return runner
+        return self._idle.get()
+    
+    def run(self, method: Callable[..., Any], *args) -> Any:
+        """Call a LeanRunner method on an idle worker, e.g. run(LeanRunner.test_full_solution, ...)"""
+        runner = self._acquire()
+        try:
+            return method(runner, *args)
+        finally:
+            self._idle.put(runner)
+    
+    async def run_async(self, method: Callable[..., Any], *args) -> Any:
+        """Async variant of run(); the Lean call happens in a worker thread"""
+        return await asyncio.to_thread(self.run, method, *args)
+    
+    def close(self):
+        """Shut down every worker's Lean server"""
+        for runner in self._runners:
+            runner.close()
+
+_shared_runner = None
+_shared_runner_lock = threading.Lock()
+
+def get_shared_runner() -> LeanRunner:
+    """The process-wide LeanRunner, whose worker pool every caller shares"""
+    global _shared_runner
+    with _shared_runner_lock:
+        if _shared_runner is None:
+            _shared_runner = LeanRunner()
+    return _shared_runner
+
 def execute_lean_code(lean_code: str, filename: str = "TempTest.lean") -> Dict:
     """
     Convenience function for executing Lean code
     Compatible with the interface expected by the testing framework
+    
+    Uses one process-wide runner so its Lean server stays warm between calls.
+    """
+    return get_shared_runner().execute_lean_code(lean_code, filename)
+
+async def execute_lean_code_async(lean_code: str, filename: str = "TempTest.lean") -> Dict:
+    """
+    Async execute_lean_code on the shared runner's worker pool
+    
+    Concurrent calls run on separate warm workers, so several files can be checked at once.
     """
-    runner = LeanRunner()
-    return runner.execute_lean_code(lean_code, filename)
+    return await get_shared_runner().pool.run_async(LeanRunner.execute_lean_code, lean_code, filename)
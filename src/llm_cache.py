@@ -0,0 +1,196 @@
+"""
+Response cache for agent LLM calls
+Exact hits are keyed by a hash of the request; near-duplicate prompts are
+matched by embedding similarity
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class LLMCache:
+    """SQLite-backed two-tier (exact + semantic) cache of chat completions"""
+
+    def __init__(self, db_path: str = None, max_entries: int = None,
+                 ttl: float = None, similarity_threshold: float = None):
+        self.db_path = Path(db_path or os.getenv('LLM_CACHE_PATH', '.cache/llm_cache.sqlite'))
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.max_entries = max_entries or int(os.getenv('LLM_CACHE_MAX_ENTRIES', 1000))
+        self.ttl = ttl if ttl is not None else float(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600))
+        self.similarity_threshold = (similarity_threshold if similarity_threshold is not None
+                                     else float(os.getenv('LLM_CACHE_SIMILARITY', 0.97)))
+        self.semantic = os.getenv('LLM_CACHE_SEMANTIC', '0') == '1'
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                hash TEXT PRIMARY KEY,
+                scope TEXT,
+                embedding BLOB,
+                response TEXT,
+                ts REAL,
+                last_used REAL
+            )"""
+        )
+        self._conn.commit()
+
+        # In-memory copy of the stored embeddings per scope, rebuilt after writes
+        self._index: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self._index_dirty = True
+
+    @staticmethod
+    def make_key(messages: List[Dict], model: str, temperature: float) -> str:
+        """Exact-match key for a chat request"""
+        payload = json.dumps(messages, sort_keys=True) + model + str(temperature)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def make_scope(model: str, temperature: float) -> str:
+        """Semantic matches are only allowed between requests with the same scope"""
+        return f"{model}|{temperature}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for an exact key, if present and fresh"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, ts FROM responses WHERE hash = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            response, ts = row
+            if self._expired(ts):
+                self._conn.execute("DELETE FROM responses WHERE hash = ?", (key,))
+                self._conn.commit()
+                self._index_dirty = True
+                return None
+
+            self._touch(key)
+            return response
+
+    def get_similar(self, embedding: np.ndarray, scope: str) -> Optional[str]:
+        """Return the response of the most similar stored prompt above the threshold"""
+        if not self.semantic or embedding is None:
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+        query = query / norm
+
+        with self._lock:
+            if self._index_dirty:
+                self._rebuild_index()
+
+            if scope not in self._index:
+                return None
+
+            hashes, matrix = self._index[scope]
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+
+            key = hashes[best]
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE hash = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            self._touch(key)
+            return row[0]
+
+    def put(self, key: str, response: str, scope: str, embedding: np.ndarray = None):
+        """Store a response, evicting least recently used entries over capacity"""
+        blob = None
+        if embedding is not None:
+            blob = np.asarray(embedding, dtype=np.float32).tobytes()
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, scope, blob, response, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+            self._index_dirty = True
+
+    def clear(self):
+        """Remove all cached responses"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._index = {}
+            self._index_dirty = True
+
+    def _expired(self, ts: float) -> bool:
+        return self.ttl > 0 and time.time() - ts > self.ttl
+
+    def _touch(self, key: str):
+        self._conn.execute(
+            "UPDATE responses SET last_used = ? WHERE hash = ?", (time.time(), key)
+        )
+        self._conn.commit()
+
+    def _evict(self):
+        """Drop expired rows, then the least recently used rows beyond max_entries"""
+        if self.ttl > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE ts < ?", (time.time() - self.ttl,)
+            )
+
+        self._conn.execute(
+            """DELETE FROM responses WHERE hash IN (
+                SELECT hash FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )""",
+            (self.max_entries,)
+        )
+
+    def _rebuild_index(self):
+        rows = self._conn.execute(
+            "SELECT hash, scope, embedding FROM responses WHERE embedding IS NOT NULL"
+        ).fetchall()
+
+        grouped: Dict[str, Tuple[List[str], List[np.ndarray]]] = {}
+        for key, scope, blob in rows:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm == 0:
+                continue
+            hashes, vectors = grouped.setdefault(scope, ([], []))
+            hashes.append(key)
+            vectors.append(vector / norm)
+
+        self._index = {
+            scope: (hashes, np.vstack(vectors))
+            for scope, (hashes, vectors) in grouped.items()
+        }
+        self._index_dirty = False
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Return the process-wide response cache, or None if disabled via LLM_CACHE=0"""
+    global _shared_cache
+    if os.getenv('LLM_CACHE', '1') != '1':
+        return None
+
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = LLMCache()
+        return _shared_cache
@@ -8,14 +8,36 @@ Date: May 30, 2025
 Three-agent system for automated theorem proving with RAG support
 """
 
-import json
+import os
 import time
-from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import itertools
+import logging
+import re
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
-from agents import PlanningAgent, GenerationAgent, VerificationAgent
+from agents import PlanningAgent, GenerationAgent, VerificationAgent, Coalescer, parse_json
 from embedding_db import EmbeddingDB
-from lean_runner import LeanRunner
+from lean_runner import LeanRunner, TRIVIAL_PROOFS, get_shared_runner
+
+logger = logging.getLogger(__name__)
+
+# Bullet or step number at the start of a plan line
+_LIST_MARKER = re.compile(r'^(?:[-*•]|\d+[.)])\s*')
+
+
+@dataclass(slots=True, frozen=True)
+class AttemptRecord:
+    """A failed attempt, fed back to later attempts"""
+    attempt: int
+    code: Optional[str] = None
+    proof: Optional[str] = None
+    error: str = ''
+    stage: str = 'unknown'
 
 
 class LeanTheoremProver:
@@ -28,17 +50,34 @@ class LeanTheoremProver:
         self.verification_agent = VerificationAgent()
         
         # Initialize RAG database
-        print("Initializing RAG database...")
+        logger.info("Initializing RAG database...")
         self.rag_db = EmbeddingDB()
         
-        # Initialize Lean runner
-        self.lean_runner = LeanRunner()
+        # Share the process-wide Lean runner, so evaluation uses the same warm workers
+        self.lean_runner = get_shared_runner()
         
         # Configuration
         self.max_attempts = 5
         self.max_verification_rounds = 3
+        self.error_text_limit = 32
+        
+        # Formatted RAG context per (query, max_chunks). Near-duplicate queries
+        # are already matched inside EmbeddingDB by embedding similarity.
+        self.rag_cache_ttl = 300
+        self.rag_cache_size = 256
+        self._rag_cache: "OrderedDict[Tuple[str, int], Tuple[float, str]]" = OrderedDict()
+        self._rag_coalescer = Coalescer()
+        
+        # Start generation from the previous attempt's plan while planning runs,
+        # keeping the result if the new plan turns out nearly the same
+        self.speculative_generation = os.getenv('SPECULATIVE_GENERATION', '0') == '1'
+        self.speculation_similarity = float(os.getenv('SPECULATION_SIMILARITY', 0.9))
     
     def main_workflow(self, problem_description: str, task_template: str) -> Dict[str, str]:
+        """Synchronous wrapper around main_workflow_async"""
+        return asyncio.run(self.main_workflow_async(problem_description, task_template))
+    
+    async def main_workflow_async(self, problem_description: str, task_template: str) -> Dict[str, str]:
         """
         Main workflow function that processes a theorem proving task
         
@@ -49,67 +88,95 @@ class LeanTheoremProver:
         Returns:
             Dict with 'code' and 'proof' keys containing the solution
         """
-        print(f"Starting theorem proving workflow...")
-        print(f"Problem: {problem_description[:100]}...")
+        logger.info("Starting theorem proving workflow...")
+        logger.info("Problem: %s...", problem_description[:100])
         
         # Track attempts and context
         context = {
             'description': problem_description,
             'task_template': task_template,
-            'attempts': [],
+            'attempts': deque(maxlen=self.max_attempts),
             'successful_implementations': [],
-            'error_patterns': set()
+            # 64-bit hashes of error signatures, with the text kept for the most recent ones
+            'error_patterns': set(),
+            'error_texts': OrderedDict(),
+            # Furthest-reaching failed attempt so far, for the best-effort fallback
+            'best_attempt': None,
+            'best_score': -1
         }
         
         for attempt in range(1, self.max_attempts + 1):
-            print(f"\n--- Attempt {attempt}/{self.max_attempts} ---")
+            logger.info("\n--- Attempt %d/%d ---", attempt, self.max_attempts)
             
             try:
-                result = self._single_attempt(context, attempt)
+                result = await self._single_attempt(context, attempt)
                 if result['success']:
-                    print(f"✅ Success on attempt {attempt}!")
+                    logger.info("✅ Success on attempt %d!", attempt)
                     return {
                         'code': result['code'],
                         'proof': result['proof']
                     }
                 else:
                     # Record failed attempt
-                    context['attempts'].append({
-                        'attempt': attempt,
-                        'code': result.get('code', ''),
-                        'proof': result.get('proof', ''),
-                        'error': result.get('error', ''),
-                        'stage': result.get('failed_stage', 'unknown')
-                    })
+                    self._record_attempt(context, AttemptRecord(
+                        attempt=attempt,
+                        code=result.get('code', ''),
+                        proof=result.get('proof', ''),
+                        error=result.get('error', ''),
+                        stage=result.get('failed_stage', 'unknown')
+                    ))
                     
                     # Extract error patterns for better learning
                     if result.get('error'):
-                        error_signature = self._extract_error_signature(result['error'])
-                        context['error_patterns'].add(error_signature)
+                        self._record_error_pattern(context, self._extract_error_signature(result['error']))
                     
             except Exception as e:
-                print(f"❌ Attempt {attempt} failed with exception: {e}")
-                context['attempts'].append({
-                    'attempt': attempt,
-                    'error': str(e),
-                    'stage': 'exception'
-                })
-        
-        print("❌ All attempts failed. Returning best effort...")
+                logger.warning("❌ Attempt %d failed with exception: %s", attempt, e)
+                self._record_attempt(context, AttemptRecord(
+                    attempt=attempt,
+                    error=str(e),
+                    stage='exception'
+                ))
+        
+        logger.warning("❌ All attempts failed. Returning best effort...")
         return self._get_best_effort_result(context)
     
-    def _single_attempt(self, context: Dict, attempt_num: int) -> Dict:
+    async def _single_attempt(self, context: Dict, attempt_num: int) -> Dict:
         """Execute a single attempt at solving the problem"""
         
+        # Both retrievals depend only on the description, so fetch them in one batch
+        planning_rag, generation_rag = await self._get_rag_contexts([
+            (f"Lean 4 planning strategy {context['description']}", 3),
+            (f"Lean 4 code proof {context['description']}", 5)
+        ])
+        
+        speculative_plan = context.get('last_plan') if self.speculative_generation else None
+        speculative_gen = None
+        if speculative_plan:
+            speculative_gen = asyncio.create_task(
+                self._generation_stage(context, speculative_plan, attempt_num, generation_rag)
+            )
+        
         # Stage 1: Planning
-        print("🎯 Planning stage...")
-        plan_result = self._planning_stage(context, attempt_num)
+        logger.debug("🎯 Planning stage...")
+        plan_result = await self._planning_stage(context, attempt_num, planning_rag)
         if not plan_result['success']:
+            if speculative_gen is not None:
+                speculative_gen.cancel()
             return {'success': False, 'failed_stage': 'planning', 'error': plan_result.get('error', '')}
+        context['last_plan'] = plan_result['plan']
         
         # Stage 2: Generation with RAG
-        print("🔨 Generation stage...")
-        gen_result = self._generation_stage(context, plan_result['plan'], attempt_num)
+        gen_result = None
+        if speculative_gen is not None:
+            if self._plans_match(speculative_plan, plan_result['plan']):
+                logger.debug("🔨 Generation stage (speculative)...")
+                gen_result = await speculative_gen
+            else:
+                speculative_gen.cancel()
+        if gen_result is None:
+            logger.debug("🔨 Generation stage...")
+            gen_result = await self._generation_stage(context, plan_result['plan'], attempt_num, generation_rag)
         if not gen_result['success']:
             return {'success': False, 'failed_stage': 'generation', 'error': gen_result.get('error', '')}
         
@@ -117,28 +184,47 @@ class LeanTheoremProver:
         proof = gen_result['proof']
         
         # Stage 3: Verification and refinement
-        print("🔍 Verification stage...")
-        verification_result = self._verification_stage(context, code, proof, attempt_num)
+        logger.debug("🔍 Verification stage...")
+        verification_result = await self._verification_stage(context, code, proof, attempt_num)
         
         return verification_result
     
-    def _planning_stage(self, context: Dict, attempt_num: int) -> Dict:
+    @staticmethod
+    def _plan_steps(plan: str) -> frozenset:
+        """Plan lines with case, spacing and list markers normalized away"""
+        steps = (_LIST_MARKER.sub('', ' '.join(line.casefold().split())) for line in plan.splitlines())
+        return frozenset(step for step in steps if step)
+    
+    def _plans_match(self, speculative_plan: str, plan: str) -> bool:
+        """Whether a generation made from speculative_plan can stand in for one made from plan"""
+        if speculative_plan == plan:
+            return True
+        # Jaccard similarity of the normalized steps: linear time, so cheap on the event loop
+        a, b = self._plan_steps(speculative_plan), self._plan_steps(plan)
+        if not a or not b:
+            return False
+        return len(a & b) / len(a | b) >= self.speculation_similarity
+    
+    @staticmethod
+    def _recent_attempts(context: Dict, count: int) -> List[Dict]:
+        """The last few attempts as dicts, for agent inputs"""
+        attempts = context['attempts']
+        return [asdict(a) for a in itertools.islice(attempts, max(0, len(attempts) - count), None)]
+    
+    async def _planning_stage(self, context: Dict, attempt_num: int, rag_context: str) -> Dict:
         """Execute planning stage with context from previous attempts"""
         
         # Enhance input with previous attempt context
         planning_input = {
             'description': context['description'],
             'task_template': context['task_template'],
-            'previous_attempts': context['attempts'][-3:],  # Last 3 attempts
-            'error_patterns': list(context['error_patterns'])
+            'previous_attempts': self._recent_attempts(context, 3),
+            'error_patterns': list(context['error_texts'].values()),
+            'rag_context': rag_context,
+            'attempt_number': attempt_num
         }
         
-        # Get relevant RAG context for planning
-        rag_query = f"Lean 4 planning strategy {context['description']}"
-        rag_context = self._get_rag_context(rag_query, max_chunks=3)
-        planning_input['rag_context'] = rag_context
-        
-        plan_response = self.planning_agent.process(planning_input)
+        plan_response = await self.planning_agent.process_async(planning_input)
         
         if plan_response.success:
             return {
@@ -152,23 +238,19 @@ class LeanTheoremProver:
                 'error': f"Planning failed: {plan_response.errors}"
             }
     
-    def _generation_stage(self, context: Dict, plan: str, attempt_num: int) -> Dict:
+    async def _generation_stage(self, context: Dict, plan: str, attempt_num: int, rag_context: str) -> Dict:
         """Execute generation stage with RAG-enhanced context"""
         
-        # Get RAG context for generation
-        rag_query = f"Lean 4 code proof {context['description']} {plan}"
-        rag_context = self._get_rag_context(rag_query, max_chunks=5)
-        
         generation_input = {
             'description': context['description'],
             'task_template': context['task_template'],
             'plan': plan,
             'rag_context': rag_context,
-            'previous_attempts': context['attempts'][-2:],  # Last 2 attempts
+            'previous_attempts': self._recent_attempts(context, 2),
             'attempt_number': attempt_num
         }
         
-        gen_response = self.generation_agent.process(generation_input)
+        gen_response = await self.generation_agent.process_async(generation_input)
         
         if not gen_response.success:
             return {
@@ -177,7 +259,8 @@ class LeanTheoremProver:
             }
         
         try:
-            result_data = json.loads(gen_response.content) if isinstance(gen_response.content, str) else gen_response.metadata
+            # The agent already parsed its output; content is the same dict re-serialized
+            result_data = gen_response.metadata if gen_response.metadata is not None else parse_json(gen_response.content)
             
             return {
                 'success': True,
@@ -191,31 +274,30 @@ class LeanTheoremProver:
                 'error': f"Failed to parse generation result: {e}"
             }
     
-    def _verification_stage(self, context: Dict, code: str, proof: str, attempt_num: int) -> Dict:
+    async def _verification_stage(self, context: Dict, code: str, proof: str, attempt_num: int) -> Dict:
         """Execute verification stage with iterative refinement"""
         
         current_code = code
         current_proof = proof
         
         for verification_round in range(1, self.max_verification_rounds + 1):
-            print(f"  🔍 Verification round {verification_round}/{self.max_verification_rounds}")
+            logger.debug("  🔍 Verification round %d/%d", verification_round, self.max_verification_rounds)
             
-            # Test implementation only first
-            impl_result = self.lean_runner.test_implementation_only(
-                context['task_template'], current_code
+            impl_failure, full_result = await self._check_solution(
+                context['task_template'], current_code, current_proof
             )
             
-            if not impl_result['success']:
-                print(f"  ❌ Implementation failed: {impl_result['error'][:100]}...")
+            if impl_failure is not None:
+                logger.debug("  ❌ Implementation failed: %s...", impl_failure['error'][:100])
                 
                 # Get verification feedback
-                fix_result = self._get_verification_feedback(
-                    current_code, current_proof, impl_result['error'], 'implementation'
+                fix_result = await self._get_verification_feedback(
+                    current_code, current_proof, impl_failure['error'], 'implementation', attempt_num
                 )
                 
                 if fix_result['success'] and fix_result.get('corrected_code'):
                     current_code = fix_result['corrected_code']
-                    print(f"  🔧 Applied implementation fix")
+                    logger.debug("  🔧 Applied implementation fix")
                     continue
                 else:
                     return {
@@ -223,40 +305,35 @@ class LeanTheoremProver:
                         'failed_stage': 'implementation_verification',
                         'code': current_code,
                         'proof': current_proof,
-                        'error': impl_result['error']
+                        'error': impl_failure['error']
                     }
             
-            print(f"  ✅ Implementation verified")
-            
-            # Test full solution (implementation + proof)
-            full_result = self.lean_runner.test_full_solution(
-                context['task_template'], current_code, current_proof
-            )
+            logger.debug("  ✅ Implementation verified")
             
             if full_result['success']:
-                print(f"  ✅ Full solution verified!")
+                logger.debug("  ✅ Full solution verified!")
                 return {
                     'success': True,
                     'code': current_code,
                     'proof': current_proof
                 }
             else:
-                print(f"  ❌ Proof failed: {full_result['error'][:100]}...")
+                logger.debug("  ❌ Proof failed: %s...", full_result['error'][:100])
                 
                 # Get verification feedback for proof
-                fix_result = self._get_verification_feedback(
-                    current_code, current_proof, full_result['error'], 'proof'
+                fix_result = await self._get_verification_feedback(
+                    current_code, current_proof, full_result['error'], 'proof', attempt_num
                 )
                 
                 if fix_result['success'] and fix_result.get('corrected_proof'):
                     current_proof = fix_result['corrected_proof']
-                    print(f"  🔧 Applied proof fix")
+                    logger.debug("  🔧 Applied proof fix")
                     continue
                 elif fix_result['success'] and fix_result.get('corrected_code'):
                     # Sometimes proof errors require code changes
                     current_code = fix_result['corrected_code']
                     current_proof = fix_result.get('corrected_proof', current_proof)
-                    print(f"  🔧 Applied combined fix")
+                    logger.debug("  🔧 Applied combined fix")
                     continue
                 else:
                     return {
@@ -276,26 +353,62 @@ class LeanTheoremProver:
             'error': "Exceeded maximum verification rounds"
         }
     
-    def _get_verification_feedback(self, code: str, proof: str, error: str, error_type: str) -> Dict:
+    async def _check_solution(self, task_template: str, code: str, proof: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """
+        Compile a candidate solution on an idle Lean worker, so concurrent tasks check in parallel
+        
+        Returns:
+            (failed implementation result or None, full solution result or None
+            when the implementation failed)
+        """
+        if proof.strip() in TRIVIAL_PROOFS:
+            # One compile with the real proof; the error location tells which part failed
+            full_result = await self.lean_runner.pool.run_async(
+                LeanRunner.test_full_solution, task_template, code, proof
+            )
+            if full_result['success']:
+                return None, full_result
+            
+            failed_part = self.lean_runner.locate_error(task_template, code, proof, full_result)
+            if failed_part == 'implementation':
+                return full_result, None
+            if failed_part == 'proof':
+                return None, full_result
+        
+        # Test implementation only first, then the full solution
+        impl_result = await self.lean_runner.pool.run_async(
+            LeanRunner.test_implementation_only, task_template, code
+        )
+        if not impl_result['success']:
+            return impl_result, None
+        
+        full_result = await self.lean_runner.pool.run_async(
+            LeanRunner.test_full_solution, task_template, code, proof
+        )
+        return None, full_result
+    
+    async def _get_verification_feedback(self, code: str, proof: str, error: str, error_type: str,
+                                         attempt_num: int) -> Dict:
         """Get debugging feedback from verification agent"""
         
         # Get RAG context for debugging
         rag_query = f"Lean 4 error debugging {error_type} {error[:200]}"
-        rag_context = self._get_rag_context(rag_query, max_chunks=3)
+        rag_context = await self._get_rag_context(rag_query, max_chunks=3)
         
         verification_input = {
             'code': code,
             'proof': proof,
             'error_output': error,
             'error_type': error_type,
-            'rag_context': rag_context
+            'rag_context': rag_context,
+            'attempt_number': attempt_num
         }
         
-        verification_response = self.verification_agent.process(verification_input)
+        verification_response = await self.verification_agent.process_async(verification_input)
         
         if verification_response.success:
             try:
-                result = json.loads(verification_response.content) if isinstance(verification_response.content, str) else verification_response.metadata
+                result = parse_json(verification_response.content) if isinstance(verification_response.content, str) else verification_response.metadata
                 return {
                     'success': True,
                     'corrected_code': result.get('corrected_code'),
@@ -308,67 +421,127 @@ class LeanTheoremProver:
         else:
             return {'success': False, 'error': f"Verification feedback failed: {verification_response.errors}"}
     
-    def _get_rag_context(self, query: str, max_chunks: int = 5) -> str:
+    async def _get_rag_context(self, query: str, max_chunks: int = 5) -> str:
         """Get relevant context from RAG database"""
+        return (await self._get_rag_contexts([(query, max_chunks)]))[0]
+    
+    async def _get_rag_contexts(self, requests: List[Tuple[str, int]]) -> List[str]:
+        """Get RAG context for several (query, max_chunks) pairs, sharing identical lookups in flight"""
+        key = Coalescer.make_key(requests)
+        return list(await self._rag_coalescer.run(key, lambda: self._fetch_rag_contexts(requests)))
+    
+    async def _fetch_rag_contexts(self, requests: List[Tuple[str, int]]) -> List[str]:
+        """Serve cached contexts and search the misses together"""
+        contexts = [None] * len(requests)
+        misses = []
+        for i, key in enumerate(requests):
+            cached = self._rag_cache.get(key)
+            if cached is not None and time.monotonic() - cached[0] < self.rag_cache_ttl:
+                self._rag_cache.move_to_end(key)
+                contexts[i] = cached[1]
+            else:
+                misses.append(i)
+        
+        if not misses:
+            return contexts
+        
+        queries = [requests[i][0] for i in misses]
+        ks = [requests[i][1] for i in misses]
         try:
-            results = self.rag_db.search(query, k=max_chunks)
-            
-            if not results:
-                return ""
-            
+            # Embedding and search block, so keep them off the event loop
+            if len(misses) == 1:
+                all_results = [await asyncio.to_thread(self.rag_db.search, queries[0], ks[0])]
+            else:
+                all_results = await asyncio.to_thread(self.rag_db.search_many, queries, ks)
+        except Exception as e:
+            logger.warning("RAG search failed: %s", e)
+            all_results = [[] for _ in misses]
+        
+        for i, results in zip(misses, all_results):
             context_parts = []
             for result in results:
                 context_parts.append(f"Source: {result['source']}\n{result['content']}\n")
+            contexts[i] = "\n---\n".join(context_parts)
             
-            return "\n---\n".join(context_parts)
-        except Exception as e:
-            print(f"RAG search failed: {e}")
-            return ""
+            # An empty result may be a failed search, so only keep real hits
+            if contexts[i]:
+                self._rag_cache[requests[i]] = (time.monotonic(), contexts[i])
+                self._rag_cache.move_to_end(requests[i])
+        
+        while len(self._rag_cache) > self.rag_cache_size:
+            self._rag_cache.popitem(last=False)
+        
+        return contexts
     
     def _extract_error_signature(self, error: str) -> str:
         """Extract a signature from error for pattern recognition"""
         # Simple error signature extraction
-        lines = error.split('\n')
         signature_parts = []
         
-        for line in lines[:3]:  # First 3 lines usually contain key info
-            if 'error:' in line.lower():
+        for line in error.split('\n', 3)[:3]:  # First 3 lines usually contain key info
+            if 'error:' in line.casefold():
                 signature_parts.append(line.strip())
         
         return ' | '.join(signature_parts)[:200]  # Limit length
     
+    def _record_error_pattern(self, context: Dict, signature: str):
+        """Add a signature to the context's pattern set, keyed by a fixed-width hash"""
+        key = int.from_bytes(hashlib.blake2b(signature.encode('utf-8'), digest_size=8).digest(), 'little')
+        if key in context['error_patterns']:
+            return
+        context['error_patterns'].add(key)
+        
+        error_texts = context['error_texts']
+        error_texts[key] = signature
+        while len(error_texts) > self.error_text_limit:
+            error_texts.popitem(last=False)
+    
+    @staticmethod
+    def _score_attempt(attempt: AttemptRecord) -> int:
+        """How far a failed attempt got"""
+        score = 0
+        if attempt.code and '-- No implementation' not in attempt.code:
+            score += 2
+        if attempt.proof and attempt.proof != 'sorry':
+            score += 1
+        if attempt.stage in ('proof_verification', 'verification_timeout'):
+            score += 1  # Got past implementation
+        return score
+    
+    def _record_attempt(self, context: Dict, attempt: AttemptRecord):
+        """Append a failed attempt, keeping the furthest-reaching one (earliest on ties)"""
+        context['attempts'].append(attempt)
+        score = self._score_attempt(attempt)
+        if score > context['best_score']:
+            context['best_score'] = score
+            context['best_attempt'] = attempt
+    
     def _get_best_effort_result(self, context: Dict) -> Dict[str, str]:
         """Return the best available result when all attempts fail"""
         
         if not context['attempts']:
             return {'code': '-- No implementation generated', 'proof': 'sorry'}
         
-        # Find the attempt that got furthest
-        best_attempt = None
-        best_score = -1
-        
-        for attempt in context['attempts']:
-            score = 0
-            if attempt.get('code') and '-- No implementation' not in attempt['code']:
-                score += 2
-            if attempt.get('proof') and attempt['proof'] != 'sorry':
-                score += 1
-            if attempt.get('stage') in ['proof_verification', 'verification_timeout']:
-                score += 1  # Got past implementation
-            
-            if score > best_score:
-                best_score = score
-                best_attempt = attempt
-        
+        best_attempt = context['best_attempt']
         if best_attempt:
             return {
-                'code': best_attempt.get('code', '-- Implementation failed'),
-                'proof': best_attempt.get('proof', 'sorry')
+                'code': best_attempt.code if best_attempt.code is not None else '-- Implementation failed',
+                'proof': best_attempt.proof if best_attempt.proof is not None else 'sorry'
             }
         else:
             return {'code': '-- All attempts failed', 'proof': 'sorry'}
 
 
+# One prover per process, so the RAG database, agents and Lean workers are set up once
+_PROVER = None
+
+def _get_prover() -> LeanTheoremProver:
+    global _PROVER
+    if _PROVER is None:
+        _PROVER = LeanTheoremProver()
+    return _PROVER
+
+
 # Main workflow function for the testing framework
 def main_workflow(problem_description: str, task_template: str) -> Dict[str, str]:
     """
@@ -382,5 +555,9 @@ def main_workflow(problem_description: str, task_template: str) -> Dict[str, str
     Returns:
         Dict containing 'code' and 'proof' keys
     """
-    prover = LeanTheoremProver()
-    return prover.main_workflow(problem_description, task_template)
+    return _get_prover().main_workflow(problem_description, task_template)
+
+
+async def main_workflow_async(problem_description: str, task_template: str) -> Dict[str, str]:
+    """Async entry point; see main_workflow"""
+    return await _get_prover().main_workflow_async(problem_description, task_template)
@@ -6,14 +6,22 @@ Processes tasks and evaluates solutions
 import os
 import json
 import sys
+import asyncio
+import logging
+import logging.handlers
+import queue
 from pathlib import Path
 from typing import Dict, List, Optional
 
 # Add src to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-from main import main_workflow
-from lean_runner import execute_lean_code
+from main import main_workflow_async
+from lean_runner import execute_lean_code, execute_lean_code_async, fill, TRIVIAL_PROOFS
+from agents import PlanningAgent
+from batch_runner import run_agent_requests
+
+logger = logging.getLogger(__name__)
 
 class TaskProcessor:
     """Processes and evaluates theorem proving tasks"""
@@ -26,13 +34,14 @@ class TaskProcessor:
         """Discover all task directories"""
         task_dirs = []
         
-        if not self.tasks_dir.exists():
-            print(f"Tasks directory {self.tasks_dir} not found")
-            return task_dirs
-        
-        for item in self.tasks_dir.iterdir():
-            if item.is_dir() and item.name.startswith('task_id_'):
-                task_dirs.append(item)
+        # DirEntry caches the file type, so there is no extra stat per entry
+        try:
+            with os.scandir(self.tasks_dir) as entries:
+                for entry in entries:
+                    if entry.name.startswith('task_id_') and entry.is_dir():
+                        task_dirs.append(Path(entry.path))
+        except FileNotFoundError:
+            logger.warning("Tasks directory %s not found", self.tasks_dir)
         
         return sorted(task_dirs)
     
@@ -40,29 +49,24 @@ class TaskProcessor:
         """Load a single task from directory"""
         try:
             # Load description
-            desc_file = task_dir / "description.txt"
-            if not desc_file.exists():
-                print(f"Missing description.txt in {task_dir}")
+            try:
+                description = (task_dir / "description.txt").read_text(encoding='utf-8').strip()
+            except FileNotFoundError:
+                logger.warning("Missing description.txt in %s", task_dir)
                 return None
             
-            with open(desc_file, 'r', encoding='utf-8') as f:
-                description = f.read().strip()
-            
             # Load task template
-            task_file = task_dir / "task.lean"
-            if not task_file.exists():
-                print(f"Missing task.lean in {task_dir}")
+            try:
+                task_template = (task_dir / "task.lean").read_text(encoding='utf-8')
+            except FileNotFoundError:
+                logger.warning("Missing task.lean in %s", task_dir)
                 return None
             
-            with open(task_file, 'r', encoding='utf-8') as f:
-                task_template = f.read()
-            
             # Load tests (optional)
-            tests_file = task_dir / "tests.lean"
-            tests_content = ""
-            if tests_file.exists():
-                with open(tests_file, 'r', encoding='utf-8') as f:
-                    tests_content = f.read()
+            try:
+                tests_content = (task_dir / "tests.lean").read_text(encoding='utf-8')
+            except FileNotFoundError:
+                tests_content = ""
             
             return {
                 'task_id': task_dir.name,
@@ -73,13 +77,24 @@ class TaskProcessor:
             }
             
         except Exception as e:
-            print(f"Error loading task {task_dir}: {e}")
+            logger.error("Error loading task %s: %s", task_dir, e)
             return None
     
     def evaluate_solution(self, task: Dict, solution: Dict) -> Dict:
-        """Evaluate a solution for a task"""
+        """Synchronous wrapper around evaluate_solution_async"""
+        return asyncio.run(self.evaluate_solution_async(task, solution))
+    
+    async def evaluate_solution_async(self, task: Dict, solution: Dict) -> Dict:
+        """
+        Evaluate a solution for a task
+        
+        The implementation-only and full-solution checks are compiled concurrently.
+        A passing full solution makes the implementation check redundant, and a
+        failing implementation makes the full result irrelevant, so whichever
+        decides the outcome first lets the other be dropped.
+        """
         task_id = task['task_id']
-        print(f"\n🧪 Evaluating solution for {task_id}")
+        logger.info("\n🧪 Evaluating solution for %s", task_id)
         
         code = solution.get('code', '')
         proof = solution.get('proof', '')
@@ -106,8 +121,7 @@ class TaskProcessor:
             }
 
         # Allow short but valid proofs like 'rfl', 'simp', etc.
-        valid_short_proofs = ['rfl', 'simp', 'omega', 'norm_num', 'ring']
-        if len(proof.strip()) < 10 and not any(valid_proof in proof.lower() for valid_proof in valid_short_proofs):
+        if len(proof.strip()) < 10 and not any(valid_proof in proof.lower() for valid_proof in TRIVIAL_PROOFS):
             return {
                 'task_id': task_id,
                 'success': False,
@@ -117,9 +131,27 @@ class TaskProcessor:
                 'score': 0
             }
         
+        impl_future = asyncio.ensure_future(self._test_implementation_async(task['task_template'], code))
+        full_future = asyncio.ensure_future(self._test_full_solution_async(task['task_template'], code, proof))
+        
         try:
+            done, _ = await asyncio.wait({impl_future, full_future}, return_when=asyncio.FIRST_COMPLETED)
+            
+            if full_future in done and full_future.result()['success']:
+                # The full solution contains the implementation, so it compiles too
+                full_test = full_future.result()
+                return {
+                    'task_id': task_id,
+                    'success': True,
+                    'error': full_test.get('error', ''),
+                    'code_compiles': True,
+                    'proof_valid': True,
+                    'score': 1.0,
+                    'execution_output': full_test.get('output', '')
+                }
+            
             # Test implementation only
-            impl_test = self._test_implementation(task['task_template'], code)
+            impl_test = await impl_future
             
             if not impl_test['success']:
                 return {
@@ -132,7 +164,7 @@ class TaskProcessor:
                 }
             
             # Test full solution
-            full_test = self._test_full_solution(task['task_template'], code, proof)
+            full_test = await full_future
             
             success = full_test['success']
             score = 1.0 if success else 0.0
@@ -156,72 +188,136 @@ class TaskProcessor:
                 'proof_valid': False,
                 'score': 0
             }
+        finally:
+            # A check that is no longer needed is abandoned; its Lean run still
+            # finishes in its worker thread and lands in the result cache
+            for future in (impl_future, full_future):
+                if not future.done():
+                    future.cancel()
+                elif not future.cancelled():
+                    future.exception()
     
     def _test_implementation(self, template: str, code: str) -> Dict:
         """Test just the implementation with proof set to sorry"""
-        test_code = template.replace('{{code}}', code)
-        test_code = test_code.replace('{{proof}}', 'sorry')
+        test_code = fill(template, code, 'sorry')
         
         return execute_lean_code(test_code, "ImplementationTest.lean")
     
     def _test_full_solution(self, template: str, code: str, proof: str) -> Dict:
         """Test the complete solution"""
-        full_code = template.replace('{{code}}', code)
-        full_code = full_code.replace('{{proof}}', proof)
+        full_code = fill(template, code, proof)
         
         return execute_lean_code(full_code, "FullSolutionTest.lean")
     
+    async def _test_implementation_async(self, template: str, code: str) -> Dict:
+        """Async _test_implementation on a pooled Lean worker"""
+        return await execute_lean_code_async(fill(template, code, 'sorry'), "ImplementationTest.lean")
+    
+    async def _test_full_solution_async(self, template: str, code: str, proof: str) -> Dict:
+        """Async _test_full_solution on a pooled Lean worker"""
+        return await execute_lean_code_async(fill(template, code, proof), "FullSolutionTest.lean")
+    
     def run_single_task(self, task_id: str) -> Optional[Dict]:
         """Run a single task by ID"""
+        result = asyncio.run(self._run_task_async(task_id))
+        if result:
+            self.results.append(result)
+        return result
+    
+    async def _run_task_async(self, task_id: str) -> Optional[Dict]:
+        """Solve and evaluate one task"""
         task_dir = self.tasks_dir / task_id
         if not task_dir.exists():
-            print(f"Task {task_id} not found")
+            logger.warning("Task %s not found", task_id)
             return None
         
         task = self.load_task(task_dir)
         if not task:
             return None
         
-        print(f"\n🚀 Processing task: {task_id}")
-        print(f"Description: {task['description'][:100]}...")
+        logger.info("\n🚀 Processing task: %s", task_id)
+        logger.info("Description: %s...", task['description'][:100])
         
         try:
-            # Run the main workflow
-            solution = main_workflow(task['description'], task['task_template'])
+            # Run the main workflow (on the process-wide prover)
+            solution = await main_workflow_async(task['description'], task['task_template'])
             
             # Evaluate the solution
-            result = self.evaluate_solution(task, solution)
+            result = await self.evaluate_solution_async(task, solution)
             result['solution'] = solution
             
-            self.results.append(result)
             return result
             
         except Exception as e:
-            print(f"❌ Task {task_id} failed: {e}")
-            result = {
+            logger.error("❌ Task %s failed: %s", task_id, e)
+            return {
                 'task_id': task_id,
                 'success': False,
                 'error': f"Workflow failed: {str(e)}",
                 'score': 0
             }
-            self.results.append(result)
-            return result
     
     def run_all_tasks(self) -> List[Dict]:
         """Run all discovered tasks"""
         task_dirs = self.discover_tasks()
         
         if not task_dirs:
-            print("No tasks found")
+            logger.warning("No tasks found")
             return []
         
-        print(f"Found {len(task_dirs)} tasks")
+        logger.info("Found %d tasks", len(task_dirs))
         
-        for task_dir in task_dirs:
-            self.run_single_task(task_dir.name)
+        if os.getenv('USE_BATCH_API', '0') == '1':
+            self._prefetch_plans(task_dirs)
+        
+        results = asyncio.run(self._run_all_tasks_async(task_dirs))
+        self.results.extend(result for result in results if result)
         
         return self.results
     
+    async def _run_all_tasks_async(self, task_dirs: List[Path]) -> List[Optional[Dict]]:
+        """Run tasks concurrently so their LLM latency overlaps"""
+        # Bound the number of tasks in flight; each one holds Lean workers while verifying
+        semaphore = asyncio.Semaphore(int(os.getenv('TASK_CONCURRENCY', 2)))
+        
+        async def run(task_dir: Path) -> Optional[Dict]:
+            async with semaphore:
+                return await self._run_task_async(task_dir.name)
+        
+        outcomes = await asyncio.gather(*[run(task_dir) for task_dir in task_dirs], return_exceptions=True)
+        
+        results = []
+        for task_dir, outcome in zip(task_dirs, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error("❌ Task %s failed: %s", task_dir.name, outcome)
+                outcome = {
+                    'task_id': task_dir.name,
+                    'success': False,
+                    'error': f"Workflow failed: {str(outcome)}",
+                    'score': 0
+                }
+            results.append(outcome)
+        return results
+    
+    def _prefetch_plans(self, task_dirs: List[Path]):
+        """Plan every task through the Batch API up front, seeding the LLM response cache"""
+        planning_agent = PlanningAgent()
+        if planning_agent.cache is None:
+            logger.info("LLM cache disabled, skipping batch planning")
+            return
+        
+        inputs = {}
+        for task_dir in task_dirs:
+            task = self.load_task(task_dir)
+            if task:
+                inputs[task['task_id']] = {
+                    'description': task['description'],
+                    'task_template': task['task_template']
+                }
+        
+        logger.info("Batch planning %d tasks...", len(inputs))
+        run_agent_requests(planning_agent, inputs)
+    
     def print_summary(self):
         """Print summary of results"""
         if not self.results:
@@ -249,6 +345,26 @@ class TaskProcessor:
             for result in failed_tasks:
                 print(f"  {result['task_id']}: {result['error'][:80]}...")
 
+def _configure_logging(verbose: bool) -> logging.handlers.QueueListener:
+    """
+    Route log records through a queue to a single writer thread,
+    so concurrent tasks never block on stdout
+    """
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.DEBUG if verbose else logging.INFO)
+    # Client libraries log every HTTP request at INFO
+    for name in ('httpx', 'openai'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    
+    listener.start()
+    return listener
+
 def main():
     """Main entry point for testing"""
     import argparse
@@ -256,19 +372,28 @@ def main():
     parser = argparse.ArgumentParser(description='Run Lean theorem proving tests')
     parser.add_argument('--task', type=str, help='Run specific task by ID')
     parser.add_argument('--tasks-dir', type=str, default='tasks', help='Tasks directory')
+    parser.add_argument('--verbose', action='store_true', help='Show per-stage progress and agent output')
     
     args = parser.parse_args()
     
+    listener = _configure_logging(args.verbose)
     processor = TaskProcessor(args.tasks_dir)
     
+    try:
+        if args.task:
+            result = processor.run_single_task(args.task)
+        else:
+            processor.run_all_tasks()
+    finally:
+        # Flush queued log records before printing the report
+        listener.stop()
+    
     if args.task:
-        result = processor.run_single_task(args.task)
         if result:
             print(f"\nResult: {'✅ SUCCESS' if result['success'] else '❌ FAILED'}")
             if not result['success']:
                 print(f"Error: {result['error']}")
     else:
-        processor.run_all_tasks()
         processor.print_summary()
 
 if __name__ == "__main__":